@@ -1,271 +1,582 @@
 import os
-import ast
-import re
-import google.generativeai as genai
 from dotenv import load_dotenv
+from result_cache import PersistentCache, make_cache_key, normalize_text
+from text_processing import CHARS_PER_TOKEN, PROFILE_TOKEN_BUDGET, compress_profile, estimate_tokens
+from resilience import DEFAULT_CALL_TIMEOUT_SECONDS, CircuitBreaker, RetryPolicy, call_with_retry, call_with_retry_async
+from rate_limiter import BACKGROUND, INTERACTIVE, RATE_LIMIT_STATE_PATH, RateLimiter, RequestCancelled
+from single_flight import SingleFlight
+from prompts import registry as prompt_registry
+from llm_backend import LLMBackend, create_backend
+import instrumentation
+from instrumentation import traced
+from schemas import (
+    ANALYSIS_ONLY_SCHEMA, ANALYSIS_TOPICS_SCHEMA, ENGAGEMENT_BATCH_SCHEMA, ENGAGEMENT_SCHEMA, MEDIA_SCHEMA, POSTS_SCHEMA, TOPICS_SCHEMA,
+    parse_json_response, to_response_schema, validate
+)
 import json
+import time
+import asyncio
+import contextvars
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables from a .env file
 load_dotenv()
 
+MODEL_NAME = 'gemini-1.5-flash'
+# Changes whenever a prompt that produces the analysis changes, so cached analyses are not reused
+ANALYSIS_PROMPT_VERSION = prompt_registry.version("analysis", "analysis_and_topics")
+
+# Persistent cache for profile analyses (set ANALYSIS_CACHE_PATH to "" to disable)
+ANALYSIS_CACHE_PATH = os.getenv(
+    "ANALYSIS_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "analysis_cache.sqlite3")
+)
+ANALYSIS_CACHE_TTL_SECONDS = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1000"))
+
+# Marker the posts prompt asks the model to place between drafts
+POST_SEPARATOR = '===POST_SEPARATOR==='
+
+# Shared deadline for the posts and media requests issued by generate_posts
+GENERATION_TIMEOUT_SECONDS = 60.0
+# How long generate_posts waits for media suggestions once the posts are ready
+MEDIA_GRACE_SECONDS = 1.0
+
+# Default limit on concurrent model requests issued through the async API
+MAX_CONCURRENT_REQUESTS = int(os.getenv("AGENT_MAX_CONCURRENCY", "8"))
+
+# Worker pool for model requests that run alongside the caller's own request
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="agent-worker")
+
+# Shared by every agent in the process, since they all talk to the same upstream
+_circuit_breaker = CircuitBreaker()
+# Meters every request made with the shared API key in this process
+_rate_limiter = RateLimiter(state_path=RATE_LIMIT_STATE_PATH)
+# Lets identical concurrent requests from different sessions share one upstream call
+_single_flight = SingleFlight()
+
 class PersonalizedPostAgent:
-    def __init__(self):
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_REQUESTS, analysis_cache: PersistentCache | None = None, backend: LLMBackend | None = None):
+        # Bounds in-flight requests per event loop for the async API
+        self.max_concurrency = max_concurrency
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._semaphores_lock = threading.Lock()
         try:
-            self.api_key = os.getenv("GEMINI_API_KEY")
-            if not self.api_key:
-                raise ValueError("GEMINI_API_KEY not found. Please set it in your .env file.")
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
+            # Without an injected backend, LLM_BACKEND picks one (Gemini by default)
+            self.backend = backend if backend is not None else create_backend(MODEL_NAME)
+            self.model_name = self.backend.model_name
         except Exception as e:
             raise RuntimeError(f"Failed to initialize AI agent: {e}")
 
+        if analysis_cache is None and ANALYSIS_CACHE_PATH:
+            try:
+                analysis_cache = PersistentCache(
+                    ANALYSIS_CACHE_PATH,
+                    ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS,
+                    max_entries=ANALYSIS_CACHE_MAX_ENTRIES
+                )
+            except Exception as e:
+                print(f"Analysis cache disabled: {e}")
+        self.analysis_cache = analysis_cache
+
+        # Outcomes of structured (JSON) responses: valid first time, valid after repair, or unusable
+        self.structured_output_stats = {"parsed": 0, "repaired": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+
+        # Set rate_limiter to None to skip client-side rate limiting (e.g. for a fake backend)
+        self.retry_policy = RetryPolicy()
+        self.circuit_breaker = _circuit_breaker
+        self.rate_limiter = _rate_limiter
+        self.single_flight = _single_flight
+
+    @traced
     def analyze_profile(self, profile_text: str) -> str:
+        return self._run(self._analyze_profile_steps(profile_text))
 
+    def _analyze_profile_steps(self, profile_text: str):
         if not profile_text or not profile_text.strip():
             raise ValueError("Profile text cannot be empty.")
 
-        prompt = f"""
-        Analyze the following professional text from a resume or LinkedIn profile.
-        Your task is to create a concise summary of the user's professional persona.
+        # Condense the resume locally first; the cache is keyed on what the model sees
+        profile_text = self.prepare_profile(profile_text)
+        cache_key = self._analysis_cache_key(profile_text)
+        cached_analysis = self._get_cached_analysis(cache_key)
+        if cached_analysis is not None:
+            return cached_analysis
 
-        **Instructions:**
-        1. Identify their industry and primary role (e.g., "Senior Software Engineer in FinTech").
-        2. List their top 3-5 core competencies or skills.
-        3. Describe their writing style and tone (e.g., "Formal and data-driven," "Casual and story-focused," "Technical and precise").
-        4. Note their level of experience (entry-level, mid-level, senior, executive).
-        5. Identify their likely audience (peers, clients, industry leaders, students).
-        6. Keep the entire analysis under 150 words.
+        prompt = self._analysis_prompt(profile_text)
+        try:
+            response = yield dict(prompt=prompt, template="analysis")
+            analysis = response.text.strip()
+        except Exception as e:
+            print(f"Error during profile analysis: {e}")
+            instrumentation.record_fallback("error_result", e)
+            return "Error: Could not analyze profile."
+        self._store_analysis(cache_key, analysis)
+        return analysis
+
+    @staticmethod
+    def prepare_profile(profile_text: str) -> str:
+        """Returns the condensed profile text that analyze_profile sends to the model."""
+        compressed_text, _ = compress_profile(profile_text)
+        # Never send an empty profile if preprocessing stripped everything,
+        # but keep the fallback within the same budget
+        return compressed_text or profile_text.strip()[:PROFILE_TOKEN_BUDGET * CHARS_PER_TOKEN]
+
+    def cached_analysis(self, profile_text: str) -> str | None:
+        """Returns the cached analysis for profile_text without calling the model, or None."""
+        return self._get_cached_analysis(self._analysis_cache_key(self.prepare_profile(profile_text)))
 
-        **Profile Text:**
-        ---
-        {profile_text}
-        ---
+    def _analysis_cache_key(self, profile_text: str) -> str:
+        return make_cache_key("analysis", self.model_name, ANALYSIS_PROMPT_VERSION, normalize_text(profile_text))
 
-        **Analysis Summary:**
+    def _get_cached_analysis(self, cache_key: str) -> str | None:
+        if self.analysis_cache is None:
+            return None
+        try:
+            analysis = self.analysis_cache.get(cache_key)
+        except Exception as e:
+            print(f"Error reading analysis cache: {e}")
+            return None
+        instrumentation.record_cache("analysis", analysis is not None)
+        return analysis
+
+    def _store_analysis(self, cache_key: str, analysis: str) -> None:
+        # Never cache failures, so the next attempt goes back to the model
+        if self.analysis_cache is None or not analysis or analysis.startswith("Error:"):
+            return
+        try:
+            self.analysis_cache.set(cache_key, analysis)
+        except Exception as e:
+            print(f"Error writing analysis cache: {e}")
+
+    @traced
+    def analyze_and_recommend(self, profile_text: str, default_topics: bool = True) -> dict:
+        """Produces the persona analysis and five topics in a single model call.
+
+        Returns {"analysis": str, "topics": list[str]}. A cached analysis, or
+        a usable analysis with unusable topics, only needs the topics call; if
+        the combined response has no usable analysis even after a repair
+        attempt, the separate analyze_profile/recommend_topics calls are used
+        instead; any other failure returns the analyze_profile error result
+        with no topics. default_topics is passed on to recommend_topics.
         """
+        return self._run(self._analyze_and_recommend_steps(profile_text, default_topics))
+
+    def _analyze_and_recommend_steps(self, profile_text: str, default_topics: bool):
+        if not profile_text or not profile_text.strip():
+            raise ValueError("Profile text cannot be empty.")
+
+        profile_text = self.prepare_profile(profile_text)
+        cache_key = self._analysis_cache_key(profile_text)
+        cached_analysis = self._get_cached_analysis(cache_key)
+        if cached_analysis is not None:
+            return {"analysis": cached_analysis, "topics": (yield from self._recommend_topics_steps(cached_analysis, default_topics))}
+
+        prompt = self._analysis_and_topics_prompt(profile_text)
         try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            result = yield from self._json_steps(prompt, ANALYSIS_TOPICS_SCHEMA, local_schema=ANALYSIS_ONLY_SCHEMA, template="analysis_and_topics")
+        except ValueError as e:
+            # Only an unusable response is worth retrying as two smaller calls
+            print(f"Error in combined analysis, falling back to separate calls: {e}")
+            instrumentation.record_fallback("separate_calls", e)
+            analysis = yield from self._analyze_profile_steps(profile_text)
+            return {"analysis": analysis, "topics": (yield from self._recommend_topics_steps(analysis, default_topics))}
         except Exception as e:
             print(f"Error during profile analysis: {e}")
-            return "Error: Could not analyze profile."
+            instrumentation.record_fallback("error_result", e)
+            return {"analysis": "Error: Could not analyze profile.", "topics": []}
+
+        analysis = result["analysis"].strip()
+        self._store_analysis(cache_key, analysis)
+        try:
+            validate(result.get("topics"), TOPICS_SCHEMA, "$.topics")
+        except ValueError as e:
+            print(f"Unusable topics in combined analysis, requesting them separately: {e}")
+            return {"analysis": analysis, "topics": (yield from self._recommend_topics_steps(analysis, default_topics))}
+        return {"analysis": analysis, "topics": result["topics"][:5]}
+
+    @traced
+    def recommend_topics(self, analysis: str, default_topics: bool = True) -> list[str]:
+        """Returns up to five topics for the analysis.
 
-    def recommend_topics(self, analysis: str) -> list[str]:
+        If the model response is unusable, returns default topics for the
+        analysis, or [] when default_topics is False (e.g. batch jobs, which
+        must not record defaults as the model's answer).
+        """
+        return self._run(self._recommend_topics_steps(analysis, default_topics))
+
+    def _recommend_topics_steps(self, analysis: str, default_topics: bool):
         if "Error" in analysis:
             return []
             
-        prompt = f"""
-        Based on this professional profile analysis, suggest five engaging and relevant topics for a LinkedIn post.
-        The topics should be distinct and align with the user's expertise and industry.
-
-        **Profile Analysis:**
-        ---
-        {analysis}
-        ---
-
-        **CRITICAL INSTRUCTIONS:**
-        - You MUST return ONLY a valid Python list format
-        - Use exactly this format: ["Topic 1", "Topic 2", "Topic 3", "Topic 4", "Topic 5"]
-        - Do not include any additional text, explanations, or formatting
-        - Each topic should be a complete, actionable phrase
-        - Topics should be 5-15 words long
-        
-        Example response format:
-        ["AI in Modern Software Development", "The Future of Remote Collaboration", "Building High-Performance Teams", "Data-Driven Decision Making", "Career Growth Strategies"]
-        """
+        prompt = self._topics_prompt(analysis)
         try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Clean the response to extract just the list part
-            if '[' in response_text and ']' in response_text:
-                start_idx = response_text.find('[')
-                end_idx = response_text.rfind(']') + 1
-                list_text = response_text[start_idx:end_idx]
-                recommended_list = ast.literal_eval(list_text)
-                
-                if isinstance(recommended_list, list) and len(recommended_list) >= 3:
-                    return recommended_list[:5]  # Return max 5 topics
-            
-            # If parsing fails, try alternative parsing
-            import re
-            # Look for quoted strings in the response
-            topics = re.findall(r'"([^"]*)"', response_text)
-            if len(topics) >= 3:
-                return topics[:5]
-                
-            # Final fallback - return default topics
-            raise ValueError("Could not parse topics from response")
-            
-        except (ValueError, SyntaxError, TypeError) as e:
+            return (yield from self._json_steps(prompt, TOPICS_SCHEMA, template="topics"))[:5]  # Return max 5 topics
+        except ValueError as e:
             print(f"Error parsing topic recommendations: {e}")
-            print(f"Raw response: {response.text if 'response' in locals() else 'No response'}")
-            # Return default topics based on analysis
-            if "software" in analysis.lower() or "engineer" in analysis.lower() or "developer" in analysis.lower():
-                return [
-                    "The Evolution of Software Development Practices",
-                    "Building Scalable and Maintainable Code",
-                    "AI Tools Transforming Developer Workflows",
-                    "Remote Team Collaboration Best Practices",
-                    "Career Growth Strategies for Tech Professionals"
-                ]
-            elif "data" in analysis.lower() or "analyst" in analysis.lower():
-                return [
-                    "Data-Driven Decision Making in Modern Business",
-                    "The Art of Data Storytelling and Visualization",
-                    "Machine Learning Applications in Industry",
-                    "Building Trust in Data Analytics",
-                    "Career Pathways in Data Science"
-                ]
-            elif "marketing" in analysis.lower():
-                return [
-                    "Digital Marketing Trends Shaping 2025",
-                    "Building Authentic Brand Connections",
-                    "The Power of Content Marketing Strategy",
-                    "Social Media Marketing Best Practices",
-                    "Measuring Marketing ROI Effectively"
-                ]
-            else:
-                return [
-                    "Leadership Lessons from Industry Challenges",
-                    "Building Resilient Professional Networks",
-                    "Innovation Strategies for Competitive Advantage",
-                    "Work-Life Balance in Modern Careers",
-                    "Future Skills for Professional Success"
-                ]
+            if not default_topics:
+                return []
+            instrumentation.record_fallback("default_topics", e)
+            return self._fallback_topics(analysis)
 
-    def generate_posts(self, topic: str, analysis: str, tone: str, purpose: str, post_format: str, char_limit: int, include_hashtags: bool, hashtag_count: int = 5, num_posts: int = 3) -> dict:
+    def _fallback_topics(self, analysis: str) -> list[str]:
+        """Default topics based on the analysis, used when the model response is unusable."""
+        if "software" in analysis.lower() or "engineer" in analysis.lower() or "developer" in analysis.lower():
+            return [
+                "The Evolution of Software Development Practices",
+                "Building Scalable and Maintainable Code",
+                "AI Tools Transforming Developer Workflows",
+                "Remote Team Collaboration Best Practices",
+                "Career Growth Strategies for Tech Professionals"
+            ]
+        elif "data" in analysis.lower() or "analyst" in analysis.lower():
+            return [
+                "Data-Driven Decision Making in Modern Business",
+                "The Art of Data Storytelling and Visualization",
+                "Machine Learning Applications in Industry",
+                "Building Trust in Data Analytics",
+                "Career Pathways in Data Science"
+            ]
+        elif "marketing" in analysis.lower():
+            return [
+                "Digital Marketing Trends Shaping 2025",
+                "Building Authentic Brand Connections",
+                "The Power of Content Marketing Strategy",
+                "Social Media Marketing Best Practices",
+                "Measuring Marketing ROI Effectively"
+            ]
+        else:
+            return [
+                "Leadership Lessons from Industry Challenges",
+                "Building Resilient Professional Networks",
+                "Innovation Strategies for Competitive Advantage",
+                "Work-Life Balance in Modern Careers",
+                "Future Skills for Professional Success"
+            ]
 
-        hashtag_instruction = f"Include {hashtag_count} relevant hashtags at the end." if include_hashtags else "Do not include hashtags."
-        
-        prompt = f"""
-        Act as a LinkedIn ghostwriter and content strategist. Your task is to generate {num_posts} distinct LinkedIn post drafts.
-
-        **CRUCIAL INSTRUCTIONS:**
-        1. **Persona Adoption:** You MUST adopt the writing style and professional persona described in the 'Profile Analysis'. The posts must sound like the user wrote them.
-        2. **Tone Alignment:** The posts MUST have a '{tone}' tone.
-        3. **Purpose Fulfillment:** The primary goal of the posts is to '{purpose}'.
-        4. **Format:** Use the '{post_format}' format structure.
-        5. **Character Limit:** Keep each post under {char_limit} characters.
-        6. **Hashtags:** {hashtag_instruction}
-        7. **CRITICAL:** Separate each post with exactly this text: ===POST_SEPARATOR===
-
-        **Profile Analysis (Your Writing Guide):**
-        ---
-        {analysis}
-        ---
-
-        **Topic to Write About:** "{topic}"
-
-        **Post Format Guidelines:**
-        - Story Format: Use narrative structure with personal anecdotes
-        - Question Format: Start with an engaging question to drive discussion
-        - List Format: Use numbered points or bullet-style content
-        - How-to Format: Provide step-by-step guidance
-        - Insight Format: Share professional observations and learnings
-        - Problem-Solution Format: Identify a challenge and present solutions
-
-        **Requirements:**
-        - Create {num_posts} unique posts that correctly synthesize the persona, tone, purpose, and format.
-        - Each post should feel authentic and engaging.
-        - Vary the hooks and content structure across posts.
-        - Use exactly ===POST_SEPARATOR=== between posts (no extra text or characters).
-        - Do not include any preamble or explanation, just the posts separated by ===POST_SEPARATOR===.
+    @traced
+    def generate_posts(self, topic: str, analysis: str, tone: str, purpose: str, post_format: str, char_limit: int, include_hashtags: bool, hashtag_count: int = 5, num_posts: int = 3, timeout: float = GENERATION_TIMEOUT_SECONDS, media_grace: float | None = MEDIA_GRACE_SECONDS) -> dict:
+        """Generates num_posts drafts plus media suggestions, both within timeout seconds.
+
+        Once the posts are ready, media is waited for media_grace seconds, or
+        until the shared deadline when media_grace is None (for headless runs
+        with no user waiting). Late or failed media is replaced by fallback
+        suggestions and the result's "media_fallback" is True.
         """
-        
-        media_prompt = f"""
-        Based on the following topic and post content style, suggest appropriate visual media types for LinkedIn posts:
 
-        **Topic:** "{topic}"
-        **Tone:** "{tone}"
-        **Format:** "{post_format}"
-        **Purpose:** "{purpose}"
+        context, prompt, media_prompt = self._posts_prompts(topic, analysis, tone, purpose, post_format, char_limit, include_hashtags, hashtag_count, num_posts, structured=True)
 
-        Provide 3-4 specific media suggestions that would complement posts about this topic. For each suggestion, include:
-        1. Media type (e.g., "Infographic", "Behind-the-scenes photo", "Video testimonial")
-        2. Brief description of what it should show
-        3. Why it would be effective for this topic
+        deadline = time.monotonic() + timeout
+        # The media prompt does not depend on the posts, so request it in parallel
+        # (in a copy of the caller's context, so its retries draw on the same session budget)
+        media_future, media_cancel = self._submit_media(media_prompt, timeout)
 
-        Format as a JSON array of objects with keys: "type", "description", "rationale"
+        try:
+            # Generate posts
+            posts = self._clean_posts(self._generate_json(prompt, POSTS_SCHEMA, timeout, context=context, template="posts")["posts"], num_posts)
+        except Exception as e:
+            print(f"Error during post generation: {e}")
+            instrumentation.record_fallback("error_result", e)
+            media_cancel.set()
+            media_future.cancel()
+            return self._failed_generation()
+
+        media_suggestions, media_fallback = self._collect_media(media_future, media_cancel, self._media_wait(deadline, media_grace), topic, tone, purpose)
+
+        return self._generation_result(posts, media_suggestions, media_fallback)
+
+    @traced
+    def generate_posts_stream(self, topic: str, analysis: str, tone: str, purpose: str, post_format: str, char_limit: int, include_hashtags: bool, hashtag_count: int = 5, num_posts: int = 3, timeout: float = GENERATION_TIMEOUT_SECONDS):
+        """Streaming variant of generate_posts.
+
+        Yields ("post", text) as soon as each post's separator arrives, then a
+        single ("result", dict) with the same shape generate_posts returns.
+        Posts are delimited by POST_SEPARATOR rather than returned as JSON,
+        so they can be split while the response is still arriving.
         """
+        context, prompt, media_prompt = self._posts_prompts(topic, analysis, tone, purpose, post_format, char_limit, include_hashtags, hashtag_count, num_posts)
+
+        deadline = time.monotonic() + timeout
+        media_future, media_cancel = self._submit_media(media_prompt, timeout)
 
         try:
-            # Generate posts
-            posts_response = self.model.generate_content(prompt)
-            posts_text = posts_response.text.strip()
-            
-            # Split by separator and clean up posts
             posts = []
-            if '===POST_SEPARATOR===' in posts_text:
-                raw_posts = posts_text.split('===POST_SEPARATOR===')
-            else:
-                # Fallback: try to split by common separators
-                for separator in ['\n---\n', '\n\n---\n\n', '---']:
-                    if separator in posts_text:
-                        raw_posts = posts_text.split(separator)
-                        break
-                else:
-                    # If no separator found, treat as single post
-                    raw_posts = [posts_text]
-            
-            for post in raw_posts:
-                cleaned_post = post.strip()
-                if cleaned_post and len(cleaned_post) > 50:  # Filter out very short fragments
-                    posts.append(cleaned_post)
-            
-            posts = posts[:num_posts]  # Limit to requested number
-            
-            # Generate media suggestions
-            media_response = self.model.generate_content(media_prompt)
+            buffer = ""
+            saw_separator = False
             try:
-                media_text = media_response.text.strip()
-                # Try to extract JSON from response
-                if '{' in media_text and '}' in media_text:
-                    start_idx = media_text.find('[')
-                    end_idx = media_text.rfind(']') + 1
-                    if start_idx >= 0 and end_idx > start_idx:
-                        json_text = media_text[start_idx:end_idx]
-                        media_suggestions = json.loads(json_text)
-                    else:
-                        raise ValueError("No JSON array found")
-                else:
-                    raise ValueError("No JSON structure found")
-            except:
-                # Fallback media suggestions based on topic and tone
-                if "technical" in tone.lower() or "data" in topic.lower():
-                    media_suggestions = [
-                        {"type": "Infographic or Data Visualization", "description": "Charts, graphs, or diagrams that illustrate your key points", "rationale": "Technical content is more engaging when visualized"},
-                        {"type": "Code Screenshot or Architecture Diagram", "description": "Clean, well-formatted code snippets or system architecture", "rationale": "Shows expertise and provides concrete examples"},
-                        {"type": "Professional Headshot", "description": "High-quality photo that builds personal connection", "rationale": "Adds human element to technical content"}
-                    ]
-                elif "story" in purpose.lower() or "personal" in purpose.lower():
-                    media_suggestions = [
-                        {"type": "Behind-the-scenes Photo", "description": "Authentic workplace moments or career journey highlights", "rationale": "Personal stories resonate better with visual context"},
-                        {"type": "Before/After Comparison", "description": "Visual showing transformation or growth", "rationale": "Demonstrates impact and results of your experience"},
-                        {"type": "Team Photo or Collaboration Shot", "description": "Images showing teamwork and professional relationships", "rationale": "Builds credibility and shows leadership skills"}
-                    ]
+                for chunk in self._generate(prompt, timeout, stream=True, context=context, template="posts"):
+                    buffer += chunk.text
+                    while POST_SEPARATOR in buffer and len(posts) < num_posts:
+                        saw_separator = True
+                        head, buffer = buffer.split(POST_SEPARATOR, 1)
+                        cleaned_post = head.strip()
+                        if len(cleaned_post) > 50:  # Filter out very short fragments
+                            posts.append(cleaned_post)
+                            yield "post", cleaned_post
+
+                # Whatever follows the last separator is the final post; without any
+                # separator fall back to the non-streaming splitting rules
+                if saw_separator:
+                    last_post = buffer.strip()
+                    remaining_posts = [last_post] if len(last_post) > 50 else []
                 else:
-                    media_suggestions = [
-                        {"type": "Professional Headshot", "description": "High-quality image that represents your professional brand", "rationale": "Builds trust and personal connection"},
-                        {"type": "Industry-related Visual", "description": "Photos or graphics related to your field", "rationale": "Provides context and demonstrates industry knowledge"},
-                        {"type": "Quote Graphic or Key Insight", "description": "Visually appealing text overlay with main message", "rationale": "Makes your content more shareable and memorable"}
-                    ]
-            
-            return {
-                "posts": posts,
-                "media_suggestions": media_suggestions,
-                "character_counts": [len(post) for post in posts]
-            }
-            
+                    remaining_posts = self._split_posts(buffer.strip(), num_posts)
+                for post in remaining_posts[:num_posts - len(posts)]:
+                    posts.append(post)
+                    yield "post", post
+            except Exception as e:
+                print(f"Error during post generation: {e}")
+                instrumentation.record_fallback("partial_posts" if posts else "error_result", e)
+                if not posts:
+                    yield "result", self._failed_generation()
+                    return
+
+            media_suggestions, media_fallback = self._collect_media(media_future, media_cancel, self._media_wait(deadline), topic, tone, purpose)
+
+            yield "result", self._generation_result(posts, media_suggestions, media_fallback)
+        finally:
+            # Also runs when the consumer stops early (e.g. a Streamlit rerun closes the
+            # generator mid-stream), so the media request never outlives the caller;
+            # a request that already finished is unaffected
+            media_cancel.set()
+            media_future.cancel()
+
+    @staticmethod
+    def _generation_result(posts: list[str], media_suggestions: list[dict], media_fallback: bool) -> dict:
+        return {
+            "posts": posts,
+            "media_suggestions": media_suggestions,
+            "character_counts": [len(post) for post in posts],
+            "media_fallback": media_fallback
+        }
+
+    @staticmethod
+    def _failed_generation() -> dict:
+        return {
+            "posts": ["Error: Could not generate posts."],
+            "media_suggestions": [],
+            "character_counts": [0],
+            "media_fallback": False
+        }
+
+    def _submit_media(self, media_prompt: str, timeout: float):
+        """Starts the media request on the worker pool; returns its future and cancel event.
+
+        Media suggestions are optional, so the request waits behind interactive
+        work, and setting the event stops it before it is admitted or sent
+        (Future.cancel() cannot stop a request that has already started).
+        """
+        cancel = threading.Event()
+        future = _executor.submit(
+            contextvars.copy_context().run, self._generate_json, media_prompt, MEDIA_SCHEMA, timeout,
+            priority=BACKGROUND, template="media", cancel=cancel
+        )
+        return future, cancel
+
+    @staticmethod
+    def _media_wait(deadline: float, grace: float | None = MEDIA_GRACE_SECONDS) -> float:
+        """Seconds to wait for media once the posts are ready: the grace period (if any), never past the shared deadline."""
+        remaining = deadline - time.monotonic()
+        return max(0.0, remaining if grace is None else min(grace, remaining))
+
+    def _collect_media(self, media_future, media_cancel: threading.Event, wait: float, topic: str, tone: str, purpose: str) -> tuple[list[dict], bool]:
+        """Returns the media suggestions, waiting at most wait seconds for them, and whether they are the fallback.
+
+        A request still pending after that is abandoned and the topic/tone
+        fallback is used instead.
+        """
+        try:
+            return media_future.result(timeout=wait), False
         except Exception as e:
-            print(f"Error during post generation: {e}")
-            return {
-                "posts": ["Error: Could not generate posts."],
-                "media_suggestions": [],
-                "character_counts": [0]
-            }
+            return self._abandon_media(e, media_cancel, media_future, topic, tone, purpose), True
+
+    def _abandon_media(self, error: Exception, media_cancel: threading.Event | None, media_future, topic: str, tone: str, purpose: str) -> list[dict]:
+        """Stops a media request that is late or failed and returns the fallback suggestions.
+
+        media_future may also be an asyncio task, which needs no cancel event.
+        """
+        print(f"Using fallback media suggestions: {error!r}")
+        instrumentation.record_fallback("default_media", error)
+        if media_cancel is not None:
+            media_cancel.set()
+        media_future.cancel()
+        return self._fallback_media_suggestions(topic, tone, purpose)
+
+    def _generate(self, prompt: str, timeout: float | None = None, stream: bool = False, generation_config: dict | None = None, priority: int = INTERACTIVE, context: str | None = None, template: str | None = None, cancel: threading.Event | None = None):
+        """Sends a prompt to the model, retrying transient failures until the timeout (in seconds) runs out.
+
+        context is static text the prompt builds on, which the backend may cache.
+        Each attempt first waits for the rate limiter at the given priority.
+        Identical concurrent non-streaming requests share one call and its result.
+        For streams only opening the stream is retried; errors while reading it reach the caller.
+        template names the prompt template, for instrumentation. Once cancel is
+        set, attempts raise RequestCancelled instead of reaching the upstream; a
+        shared request is only abandoned once every caller waiting on it has
+        set its event.
+        """
+        timeout = timeout or DEFAULT_CALL_TIMEOUT_SECONDS
+        request_key = self._request_key(prompt, generation_config, context)
+        send = self.backend.stream if stream else self.backend.generate
+        span = instrumentation.start_call(template)
+
+        def call(cancel):
+            def attempt(remaining):
+                span.attempts += 1
+                if self.rate_limiter is not None:
+                    started = time.monotonic()
+                    self.rate_limiter.acquire(estimate_tokens(prompt) + estimate_tokens(context or ""), priority, timeout=remaining, cancel=cancel)
+                    remaining = max(0.001, remaining - (time.monotonic() - started))
+                if cancel is not None and cancel.is_set():
+                    raise RequestCancelled("Request abandoned before it was sent")
+                return send(prompt, context=context, generation_config=generation_config, timeout=remaining)
+
+            return call_with_retry(attempt, timeout, breaker=self.circuit_breaker, policy=self.retry_policy)
+
+        try:
+            # A stream is read incrementally by a single caller, so it is never shared
+            if stream:
+                return instrumentation.traced_stream(call(cancel), span)
+            response = self.single_flight.do(request_key, call, timeout, cancel=cancel)
+        except Exception as e:
+            span.finish(e)
+            raise
+        span.set_usage(getattr(response, "usage_metadata", None))
+        span.finish()
+        return response
+
+    def _request_key(self, prompt: str, generation_config: dict | None, context: str | None = None) -> str:
+        """Identifies a request by its model, normalized prompt and context, and generation config."""
+        return make_cache_key(
+            self.model_name,
+            normalize_text(prompt),
+            normalize_text(context or ""),
+            json.dumps(generation_config, sort_keys=True, default=str)
+        )
+
+    def _generate_json(self, prompt: str, schema: dict, timeout: float | None = None, local_schema: dict | None = None, priority: int = INTERACTIVE, context: str | None = None, template: str | None = None, cancel: threading.Event | None = None):
+        """Requests JSON output matching schema, with one targeted repair attempt.
+
+        local_schema overrides what is validated locally, for callers that
+        handle invalid items themselves. timeout bounds both calls together,
+        and cancel is passed on to both.
+        Raises ValueError if the response is still invalid after the repair
+        attempt, or is invalid with no time left for one.
+        """
+        return self._run(self._json_steps(prompt, schema, timeout, local_schema, priority, context, template), cancel=cancel)
+
+    def _json_steps(self, prompt: str, schema: dict, timeout: float | None = None, local_schema: dict | None = None, priority: int = INTERACTIVE, context: str | None = None, template: str | None = None):
+        deadline = time.monotonic() + (timeout or DEFAULT_CALL_TIMEOUT_SECONDS)
+        generation_config = self._json_generation_config(schema)
+        response = yield dict(prompt=prompt, timeout=timeout, generation_config=generation_config, priority=priority, context=context, template=template)
+        try:
+            result = parse_json_response(response.text, local_schema or schema)
+            self._record_structured_output("parsed")
+            return result
+        except ValueError as e:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"Invalid structured response and no time left for a repair: {e}")
+                self._record_structured_output("failed")
+                raise
+            print(f"Invalid structured response, requesting a repair: {e}")
+            repair_prompt = self._repair_prompt(response, schema, e)
+
+        # The repair prompt carries everything needed, so it is sent without the context
+        response = yield dict(prompt=repair_prompt, timeout=remaining, generation_config=generation_config, priority=priority, template="repair")
+        try:
+            result = parse_json_response(response.text, local_schema or schema)
+        except ValueError:
+            self._record_structured_output("failed")
+            raise
+        self._record_structured_output("repaired")
+        return result
+
+    def _run(self, steps, cancel: threading.Event | None = None):
+        """Runs a *_steps generator, sending each request it yields with _generate.
+
+        The generators hold the parsing and fallback logic shared by the sync
+        and async methods: each yields the _generate arguments for a model
+        call and gets back the response, or has the call's error raised at
+        the yield. Returns the generator's return value.
+        """
+        response, error = None, None
+        try:
+            while True:
+                request = steps.throw(error) if error is not None else steps.send(response)
+                try:
+                    response, error = self._generate(**request, cancel=cancel), None
+                except Exception as e:
+                    response, error = None, e
+        except StopIteration as done:
+            return done.value
+
+    def _json_generation_config(self, schema: dict) -> dict:
+        return {"response_mime_type": "application/json", "response_schema": to_response_schema(schema)}
+
+    def _repair_prompt(self, response, schema: dict, error: Exception) -> str:
+        """Asks the model to fix only the structure of its previous response."""
+        try:
+            previous_text = response.text
+        except ValueError:
+            previous_text = ""  # Blocked or empty responses have no text
+        return prompt_registry.render("repair", error=error, schema=json.dumps(schema), previous_text=previous_text)
+
+    def _record_structured_output(self, outcome: str) -> None:
+        with self._stats_lock:
+            self.structured_output_stats[outcome] += 1
 
-    def get_format_suggestions(self) -> list[str]:
+    def _split_posts(self, posts_text: str, num_posts: int) -> list[str]:
+        """Splits the raw model output into cleaned post drafts."""
+        if POST_SEPARATOR in posts_text:
+            raw_posts = posts_text.split(POST_SEPARATOR)
+        else:
+            # Fallback: try to split by common separators
+            for separator in ['\n---\n', '\n\n---\n\n', '---']:
+                if separator in posts_text:
+                    raw_posts = posts_text.split(separator)
+                    break
+            else:
+                # If no separator found, treat as single post
+                raw_posts = [posts_text]
+        
+        return self._clean_posts(raw_posts, num_posts)
+
+    def _clean_posts(self, raw_posts: list[str], num_posts: int) -> list[str]:
+        """Strips posts, drops very short fragments and limits the count."""
+        posts = []
+        for post in raw_posts:
+            cleaned_post = post.strip()
+            if cleaned_post and len(cleaned_post) > 50:  # Filter out very short fragments
+                posts.append(cleaned_post)
+        
+        return posts[:num_posts]  # Limit to requested number
+
+    def _fallback_media_suggestions(self, topic: str, tone: str, purpose: str) -> list[dict]:
+        """Media suggestions based on topic and tone, used when the model response is unavailable."""
+        if "technical" in tone.lower() or "data" in topic.lower():
+            return [
+                {"type": "Infographic or Data Visualization", "description": "Charts, graphs, or diagrams that illustrate your key points", "rationale": "Technical content is more engaging when visualized"},
+                {"type": "Code Screenshot or Architecture Diagram", "description": "Clean, well-formatted code snippets or system architecture", "rationale": "Shows expertise and provides concrete examples"},
+                {"type": "Professional Headshot", "description": "High-quality photo that builds personal connection", "rationale": "Adds human element to technical content"}
+            ]
+        elif "story" in purpose.lower() or "personal" in purpose.lower():
+            return [
+                {"type": "Behind-the-scenes Photo", "description": "Authentic workplace moments or career journey highlights", "rationale": "Personal stories resonate better with visual context"},
+                {"type": "Before/After Comparison", "description": "Visual showing transformation or growth", "rationale": "Demonstrates impact and results of your experience"},
+                {"type": "Team Photo or Collaboration Shot", "description": "Images showing teamwork and professional relationships", "rationale": "Builds credibility and shows leadership skills"}
+            ]
+        else:
+            return [
+                {"type": "Professional Headshot", "description": "High-quality image that represents your professional brand", "rationale": "Builds trust and personal connection"},
+                {"type": "Industry-related Visual", "description": "Photos or graphics related to your field", "rationale": "Provides context and demonstrates industry knowledge"},
+                {"type": "Quote Graphic or Key Insight", "description": "Visually appealing text overlay with main message", "rationale": "Makes your content more shareable and memorable"}
+            ]
+
+    @staticmethod
+    def get_format_suggestions() -> list[str]:
         return [
             "Story Format",
             "Question Format", 
@@ -275,79 +586,269 @@ class PersonalizedPostAgent:
             "Problem-Solution Format"
         ]
 
+    @traced
     def estimate_engagement_potential(self, post_content: str) -> dict:
-        prompt = f"""
-        Analyze this LinkedIn post and provide engagement potential insights.
-
-        **Post Content:**
-        ---
-        {post_content}
-        ---
-
-        **CRITICAL INSTRUCTIONS:**
-        - Rate each aspect on a scale of 1-5 (1=poor, 5=excellent)
-        - Provide specific, actionable reasoning for each score
-        - Return ONLY valid JSON format with no additional text
-        - Use exactly this structure:
-
-        {{
-            "hook_strength": {{"score": X, "reason": "Brief explanation of opening line effectiveness"}},
-            "content_value": {{"score": X, "reason": "Assessment of educational or inspirational worth"}},
-            "discussion_potential": {{"score": X, "reason": "Likelihood to generate meaningful comments"}},
-            "shareability": {{"score": X, "reason": "Potential for shares and reposts"}}
-        }}
-
-        Analyze:
-        1. Hook strength: How compelling is the opening? Does it grab attention?
-        2. Content value: Does it teach, inspire, or provide useful insights?
-        3. Discussion potential: Will people comment with questions/thoughts?
-        4. Shareability: Is it worth sharing with others?
-        """
+        return self._run(self._engagement_steps(post_content))
+
+    def _engagement_steps(self, post_content: str):
+        prompt = self._engagement_prompt(post_content)
         
         try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Clean the response to extract JSON
-            if '{' in response_text and '}' in response_text:
-                start_idx = response_text.find('{')
-                end_idx = response_text.rfind('}') + 1
-                json_text = response_text[start_idx:end_idx]
-                parsed_data = json.loads(json_text)
-                
-                # Validate structure
-                required_keys = ['hook_strength', 'content_value', 'discussion_potential', 'shareability']
-                if all(key in parsed_data for key in required_keys):
-                    # Ensure each item has score and reason
-                    for key in required_keys:
-                        if not isinstance(parsed_data[key], dict) or 'score' not in parsed_data[key] or 'reason' not in parsed_data[key]:
-                            raise ValueError(f"Invalid structure for {key}")
-                    return parsed_data
-                    
-            raise ValueError("Invalid JSON structure")
-            
+            return (yield from self._json_steps(prompt, ENGAGEMENT_SCHEMA, priority=BACKGROUND, context=self._engagement_context(), template="engagement"))
         except Exception as e:
             print(f"Error in engagement analysis: {e}")
-            # Provide more meaningful fallback analysis based on post content
-            word_count = len(post_content.split())
-            has_question = '?' in post_content
-            has_hashtags = '#' in post_content
-            
-            return {
-                "hook_strength": {
-                    "score": 4 if len(post_content.split('\n')[0]) < 100 else 3, 
-                    "reason": "Opening line length suggests good attention-grabbing potential"
-                },
-                "content_value": {
-                    "score": 4 if word_count > 50 else 3, 
-                    "reason": f"Content length ({word_count} words) indicates substantial value"
-                },
-                "discussion_potential": {
-                    "score": 4 if has_question else 3, 
-                    "reason": "Question format encourages audience interaction" if has_question else "Content may generate thoughtful responses"
-                },
-                "shareability": {
-                    "score": 4 if has_hashtags else 3, 
-                    "reason": "Hashtags increase discoverability" if has_hashtags else "Valuable content with good share potential"
-                }
-            }
\ No newline at end of file
+            instrumentation.record_fallback("heuristic_engagement", e)
+            return self._fallback_engagement(post_content)
+
+    @traced
+    def estimate_engagement_batch(self, posts: list[str], heuristic_fallback: bool = True) -> list[dict]:
+        """Scores several posts with a single model call.
+
+        Returns one engagement dict per post, in order. Items the model
+        omits or returns malformed get the per-post fallback heuristic; with
+        heuristic_fallback=False the error is raised instead.
+        """
+        return self._run(self._engagement_batch_steps(posts, heuristic_fallback))
+
+    def _engagement_batch_steps(self, posts: list[str], heuristic_fallback: bool):
+        if not posts:
+            return []
+
+        prompt = self._engagement_batch_prompt(posts)
+
+        try:
+            # Only the array itself is validated here, so one bad item
+            # falls back on its own instead of failing the whole batch
+            parsed_items = yield from self._json_steps(prompt, ENGAGEMENT_BATCH_SCHEMA, local_schema={"type": "array"}, priority=BACKGROUND, context=self._engagement_context(), template="engagement_batch")
+        except Exception as e:
+            print(f"Error in batch engagement analysis: {e}")
+            if not heuristic_fallback:
+                raise
+            instrumentation.record_fallback("heuristic_engagement", e)
+            parsed_items = []
+        return self._match_engagement_batch(parsed_items, posts, heuristic_fallback)
+
+    def _match_engagement_batch(self, parsed_items: list, posts: list[str], heuristic_fallback: bool = True) -> list[dict]:
+        """Maps parsed engagement dicts onto posts, falling back per item."""
+        results = []
+        for i, post in enumerate(posts):
+            try:
+                item = parsed_items[i] if i < len(parsed_items) else None
+                validate(item, ENGAGEMENT_SCHEMA)
+                results.append(item)
+            except ValueError as e:
+                print(f"Error in engagement analysis for post {i + 1}: {e}")
+                if not heuristic_fallback:
+                    raise
+                instrumentation.record_fallback("heuristic_engagement", e)
+                results.append(self._fallback_engagement(post))
+        return results
+
+    def _fallback_engagement(self, post_content: str) -> dict:
+        """Heuristic engagement analysis used when the model response is unusable."""
+        word_count = len(post_content.split())
+        has_question = '?' in post_content
+        has_hashtags = '#' in post_content
+        
+        return {
+            "hook_strength": {
+                "score": 4 if len(post_content.split('\n')[0]) < 100 else 3, 
+                "reason": "Opening line length suggests good attention-grabbing potential"
+            },
+            "content_value": {
+                "score": 4 if word_count > 50 else 3, 
+                "reason": f"Content length ({word_count} words) indicates substantial value"
+            },
+            "discussion_potential": {
+                "score": 4 if has_question else 3, 
+                "reason": "Question format encourages audience interaction" if has_question else "Content may generate thoughtful responses"
+            },
+            "shareability": {
+                "score": 4 if has_hashtags else 3, 
+                "reason": "Hashtags increase discoverability" if has_hashtags else "Valuable content with good share potential"
+            }
+        }
+
+    # --- Async API ---
+
+    @traced
+    async def analyze_profile_async(self, profile_text: str) -> str:
+        return await self._run_async(self._analyze_profile_steps(profile_text))
+
+    @traced
+    async def analyze_and_recommend_async(self, profile_text: str, default_topics: bool = True) -> dict:
+        return await self._run_async(self._analyze_and_recommend_steps(profile_text, default_topics))
+
+    @traced
+    async def recommend_topics_async(self, analysis: str, default_topics: bool = True) -> list[str]:
+        return await self._run_async(self._recommend_topics_steps(analysis, default_topics))
+
+    @traced
+    async def generate_posts_async(self, topic: str, analysis: str, tone: str, purpose: str, post_format: str, char_limit: int, include_hashtags: bool, hashtag_count: int = 5, num_posts: int = 3, timeout: float = GENERATION_TIMEOUT_SECONDS, media_grace: float | None = MEDIA_GRACE_SECONDS) -> dict:
+        context, prompt, media_prompt = self._posts_prompts(topic, analysis, tone, purpose, post_format, char_limit, include_hashtags, hashtag_count, num_posts, structured=True)
+
+        deadline = time.monotonic() + timeout
+        # Optional, so it waits behind interactive work as on the sync path
+        media_task = asyncio.ensure_future(self._generate_json_async(media_prompt, MEDIA_SCHEMA, timeout, priority=BACKGROUND, template="media"))
+        try:
+            try:
+                posts_result = await asyncio.wait_for(self._generate_json_async(prompt, POSTS_SCHEMA, timeout, context=context, template="posts"), timeout)
+                posts = self._clean_posts(posts_result["posts"], num_posts)
+            except Exception as e:
+                print(f"Error during post generation: {e}")
+                instrumentation.record_fallback("error_result", e)
+                return self._failed_generation()
+
+            try:
+                media_suggestions, media_fallback = await asyncio.wait_for(asyncio.shield(media_task), self._media_wait(deadline, media_grace)), False
+            except Exception as e:
+                media_suggestions, media_fallback = self._abandon_media(e, None, media_task, topic, tone, purpose), True
+        finally:
+            # Also runs on cancellation, so the media request never outlives the caller
+            media_task.cancel()
+
+        return self._generation_result(posts, media_suggestions, media_fallback)
+
+    @traced
+    async def estimate_engagement_potential_async(self, post_content: str) -> dict:
+        return await self._run_async(self._engagement_steps(post_content))
+
+    @traced
+    async def estimate_engagement_batch_async(self, posts: list[str], heuristic_fallback: bool = True) -> list[dict]:
+        return await self._run_async(self._engagement_batch_steps(posts, heuristic_fallback))
+
+    async def _generate_async(self, prompt: str, timeout: float | None = None, generation_config: dict | None = None, priority: int = INTERACTIVE, context: str | None = None, template: str | None = None):
+        """Async counterpart of _generate, bounded by the per-event-loop semaphore."""
+        request_key = self._request_key(prompt, generation_config, context)
+        span = instrumentation.start_call(template)
+
+        async def attempt(remaining):
+            span.attempts += 1
+            if self.rate_limiter is not None:
+                started = time.monotonic()
+                await self.rate_limiter.acquire_async(estimate_tokens(prompt) + estimate_tokens(context or ""), priority, timeout=remaining)
+                remaining = max(0.001, remaining - (time.monotonic() - started))
+            # Hold the semaphore per attempt, not while backing off between attempts
+            async with self._get_semaphore():
+                return await self.backend.generate_async(prompt, context=context, generation_config=generation_config, timeout=remaining)
+
+        try:
+            response = await self.single_flight.do_async(
+                request_key,
+                lambda: call_with_retry_async(attempt, timeout or DEFAULT_CALL_TIMEOUT_SECONDS, breaker=self.circuit_breaker, policy=self.retry_policy)
+            )
+        except BaseException as e:
+            span.finish(e)
+            raise
+        span.set_usage(getattr(response, "usage_metadata", None))
+        span.finish()
+        return response
+
+    async def _generate_json_async(self, prompt: str, schema: dict, timeout: float | None = None, local_schema: dict | None = None, priority: int = INTERACTIVE, context: str | None = None, template: str | None = None):
+        """Async counterpart of _generate_json."""
+        return await self._run_async(self._json_steps(prompt, schema, timeout, local_schema, priority, context, template))
+
+    async def _run_async(self, steps):
+        """Async counterpart of _run, sending each request with _generate_async."""
+        response, error = None, None
+        try:
+            while True:
+                request = steps.throw(error) if error is not None else steps.send(response)
+                try:
+                    response, error = await self._generate_async(**request), None
+                except Exception as e:
+                    response, error = None, e
+        except StopIteration as done:
+            return done.value
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Returns the concurrency semaphore for the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._semaphores_lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._semaphores[loop] = semaphore
+            return semaphore
+
+    # --- Prompt builders ---
+
+    def _analysis_prompt(self, profile_text: str) -> str:
+        return prompt_registry.render("analysis", profile_text=profile_text)
+
+    def _topics_prompt(self, analysis: str) -> str:
+        return prompt_registry.render("topics", analysis=analysis)
+
+    def _analysis_and_topics_prompt(self, profile_text: str) -> str:
+        return prompt_registry.render("analysis_and_topics", profile_text=profile_text)
+
+    def _posts_prompts(self, topic: str, analysis: str, tone: str, purpose: str, post_format: str, char_limit: int, include_hashtags: bool, hashtag_count: int, num_posts: int, structured: bool = False) -> tuple[str, str, str]:
+        """Returns the posts context, the posts prompt and the media prompt.
+
+        The context holds the instructions and analysis shared by every
+        generation for a session; the posts prompt holds only this request's
+        settings. With structured=True the posts are requested as a JSON object (see
+        POSTS_SCHEMA); otherwise they are delimited by POST_SEPARATOR, which
+        the streaming path needs.
+        """
+        hashtag_instruction = f"Include {hashtag_count} relevant hashtags at the end." if include_hashtags else "Do not include hashtags."
+        if structured:
+            output_instruction = f'Return a JSON object whose "posts" array holds exactly {num_posts} post strings.'
+            output_requirements = "- Do not include any preamble or explanation, just the JSON object."
+        else:
+            output_instruction = f"Separate each post with exactly this text: {POST_SEPARATOR}"
+            output_requirements = (
+                f"- Use exactly {POST_SEPARATOR} between posts (no extra text or characters).\n"
+                f"- Do not include any preamble or explanation, just the posts separated by {POST_SEPARATOR}."
+            )
+
+        context = prompt_registry.render("posts_context", analysis=analysis)
+        prompt = prompt_registry.render(
+            "posts",
+            topic=topic, tone=tone, purpose=purpose, post_format=post_format,
+            char_limit=char_limit, num_posts=num_posts, hashtag_instruction=hashtag_instruction,
+            output_instruction=output_instruction, output_requirements=output_requirements
+        )
+        media_prompt = prompt_registry.render("media", topic=topic, tone=tone, post_format=post_format, purpose=purpose)
+        return context, prompt, media_prompt
+
+    def _engagement_context(self) -> str:
+        return prompt_registry.render("engagement_context")
+
+    def _engagement_prompt(self, post_content: str) -> str:
+        return prompt_registry.render("engagement", post_content=post_content)
+
+    def _engagement_batch_prompt(self, posts: list[str]) -> str:
+        numbered_posts = "\n\n".join(
+            f"**Post {i + 1}:**\n---\n{post}\n---" for i, post in enumerate(posts)
+        )
+        return prompt_registry.render("engagement_batch", post_count=len(posts), numbered_posts=numbered_posts)
+
+_shared_agent = None
+_shared_agent_lock = threading.Lock()
+
+def get_shared_agent() -> PersonalizedPostAgent:
+    """Returns the process-wide agent, creating it on first use.
+
+    The model client is configured once and reused by every session and
+    thread; a failed initialization is not cached, so the next call retries.
+    """
+    global _shared_agent
+    if _shared_agent is None:
+        with _shared_agent_lock:
+            if _shared_agent is None:
+                _shared_agent = PersonalizedPostAgent()
+    return _shared_agent
+
+
+def pipeline_stats() -> dict:
+    """Returns live state shared by every session: circuit breaker, rate limiter, request coalescing and agent counters."""
+    agent = _shared_agent
+    context_cache = getattr(agent.backend, "context_cache", None) if agent else None
+    return {
+        "circuit_breaker": _circuit_breaker.state,
+        "rate_limiter": _rate_limiter.stats(),
+        "single_flight": _single_flight.stats(),
+        "structured_output": dict(agent.structured_output_stats) if agent else None,
+        "context_cache": dict(context_cache.stats) if context_cache else None
+    }
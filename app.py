@@ -1,9 +1,14 @@
 import streamlit as st
-import PyPDF2
-from io import BytesIO
-from ai_agent import PersonalizedPostAgent
+from ai_agent import PersonalizedPostAgent, get_shared_agent
+from pdf_extractor import extract_pdf_bytes
+from text_processing import compress_profile
+from resilience import RetryBudget, set_retry_budget
+from health_check import HEALTH_SERVER_IN_APP, readiness_payload, start_health_server
+from readiness import get_probe
 import time
 import json
+import hashlib
+import html
 import datetime
 import os
 import sys
@@ -16,13 +21,21 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Serve /health and /metrics from this process (started once; later reruns reuse it)
+if HEALTH_SERVER_IN_APP:
+    start_health_server(int(os.environ.get('HEALTH_PORT', 8080)))
+# Start probing the upstream now, so ?health has a result by the time it is asked
+get_probe()
+
 # Health Check Query Parameter Handler (MUST be at the top before any other Streamlit code)
 query_params = st.query_params
 
 if "health" in query_params:
-    # Simple health check response
+    # Readiness from cached upstream probes (the same report as /ready on the health server)
+    readiness = readiness_payload()
     st.json({
-        "status": "healthy",
+        "status": {"ready": "healthy", "starting": "starting"}.get(readiness["state"], "unhealthy"),
+        "readiness": readiness,
         "timestamp": datetime.datetime.now().isoformat(),
         "service": "AI LinkedIn Post Generator",
         "version": "1.0.0",
@@ -315,6 +328,8 @@ if 'analysis' not in st.session_state:
     st.session_state.analysis = ""
 if 'recommendations' not in st.session_state:
     st.session_state.recommendations = []
+if 'profile_stats' not in st.session_state:
+    st.session_state.profile_stats = {}
 if 'selected_topic' not in st.session_state:
     st.session_state.selected_topic = ""
 if 'selected_tone' not in st.session_state:
@@ -331,16 +346,24 @@ if 'hashtag_count' not in st.session_state:
     st.session_state.hashtag_count = 5
 if 'num_posts' not in st.session_state:
     st.session_state.num_posts = 3
+if 'generation_results' not in st.session_state:
+    st.session_state.generation_results = {}
+if 'engagement_results' not in st.session_state:
+    st.session_state.engagement_results = {}
+if 'retry_budget' not in st.session_state:
+    st.session_state.retry_budget = RetryBudget()
+
+# Model retries made during this run are paid for from this session's budget
+set_retry_budget(st.session_state.retry_budget)
 
 
 # --- Helper Functions ---
-def pdf_to_text(file):
-    """Extracts text from an uploaded PDF file."""
+def pdf_to_text(data):
+    """Extracts text from uploaded PDF bytes within the page/character budget."""
     try:
-        pdf_reader = PyPDF2.PdfReader(file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() or ""
+        text, metadata = extract_pdf_bytes(data)
+        if metadata["truncated"]:
+            st.info(f"ℹ️ Your resume is long, so only the first {metadata['pages_read']} of {metadata['total_pages']} pages ({metadata['chars']} characters) were used.")
         return text
     except Exception as e:
         st.error(f"Error reading PDF file: {e}")
@@ -354,6 +377,56 @@ def reset_app():
     st.session_state.stage = 'input'
     st.rerun()
 
+def get_generation_key():
+    """Returns the settings tuple that identifies a set of generated posts."""
+    return (
+        st.session_state.selected_topic,
+        st.session_state.analysis,
+        st.session_state.selected_tone,
+        st.session_state.selected_purpose,
+        st.session_state.selected_format,
+        st.session_state.char_limit,
+        st.session_state.include_hashtags,
+        st.session_state.hashtag_count,
+        st.session_state.num_posts
+    )
+
+def request_new_variations():
+    """Drops the stored result for the current settings so the next run regenerates."""
+    st.session_state.generation_results.pop(get_generation_key(), None)
+
+def get_post_digest(post):
+    """Returns a content hash used to memoize engagement analysis for a post."""
+    return hashlib.sha256(post.strip().encode('utf-8')).hexdigest()
+
+def stream_post_previews(agent):
+    """Streams new posts into read-only preview cards and returns the final result."""
+    previews = st.container()
+    result = None
+    for event, payload in agent.generate_posts_stream(
+        topic=st.session_state.selected_topic,
+        analysis=st.session_state.analysis,
+        tone=st.session_state.selected_tone,
+        purpose=st.session_state.selected_purpose,
+        post_format=st.session_state.selected_format,
+        char_limit=st.session_state.char_limit,
+        include_hashtags=st.session_state.include_hashtags,
+        hashtag_count=st.session_state.hashtag_count,
+        num_posts=st.session_state.num_posts
+    ):
+        if event == "post":
+            with previews:
+                post_html = html.escape(payload).replace("\n", "<br>")
+                st.markdown(f"""
+                <div class="post-card">
+                    <span class="char-count">{len(payload)}/{st.session_state.char_limit} characters</span>
+                    <p>{post_html}</p>
+                </div>
+                """, unsafe_allow_html=True)
+        else:
+            result = payload
+    return result
+
 def get_step_indicator():
     """Returns HTML for step indicator."""
     steps = [
@@ -529,7 +602,7 @@ if st.session_state.stage == 'input':
     with col2:
         if st.button("🔍 Analyze My Profile", type="primary", use_container_width=True):
             if uploaded_file:
-                st.session_state.profile_text = pdf_to_text(BytesIO(uploaded_file.getvalue()))
+                st.session_state.profile_text = pdf_to_text(uploaded_file.getvalue())
             elif pasted_text:
                 st.session_state.profile_text = pasted_text
             else:
@@ -549,9 +622,12 @@ elif st.session_state.stage == 'recommend':
     with st.spinner("🔍 Analyzing your profile and generating topic ideas..."):
         if not st.session_state.analysis:
             try:
-                agent = PersonalizedPostAgent()
-                st.session_state.analysis = agent.analyze_profile(st.session_state.profile_text)
-                st.session_state.recommendations = agent.recommend_topics(st.session_state.analysis)
+                agent = get_shared_agent()
+                profile_result = agent.analyze_and_recommend(st.session_state.profile_text)
+                st.session_state.analysis = profile_result["analysis"]
+                st.session_state.recommendations = profile_result["topics"]
+                # Measured once per analysis, not on every rerun of this stage
+                _, st.session_state.profile_stats = compress_profile(st.session_state.profile_text)
             except Exception as e:
                 st.error(f"❌ Failed to initialize the AI Agent. Check your GEMINI_API_KEY. Error: {e}")
                 st.session_state.stage = 'input'
@@ -564,6 +640,11 @@ elif st.session_state.stage == 'recommend':
     </div>
     """, unsafe_allow_html=True)
     
+    # Report how much the local preprocessing trimmed from the prompt
+    profile_stats = st.session_state.profile_stats
+    if profile_stats.get("saved_tokens", 0) > 0:
+        st.caption(f"🗜️ Profile condensed from ~{profile_stats['original_tokens']} to ~{profile_stats['compressed_tokens']} tokens before analysis.")
+    
     st.markdown("### 💡 Recommended Topics")
     st.markdown("Based on your profile, here are some engaging topic ideas:")
     
@@ -623,8 +704,7 @@ elif st.session_state.stage == 'refine':
             help="The overall tone and mood of your posts"
         )
 
-        agent = PersonalizedPostAgent()
-        format_options = agent.get_format_suggestions()
+        format_options = PersonalizedPostAgent.get_format_suggestions()
         st.session_state.selected_format = st.selectbox(
             "Select Format",
             format_options,
@@ -729,30 +809,43 @@ elif st.session_state.stage == 'generate':
         </div>
         """, unsafe_allow_html=True)
 
-    # Generate posts
+    # Generate posts (reruns reuse the stored result for the same settings)
     with st.spinner("✨ Creating personalized posts in your unique style..."):
         try:
-            agent = PersonalizedPostAgent()
-            result = agent.generate_posts(
-                topic=st.session_state.selected_topic,
-                analysis=st.session_state.analysis,
-                tone=st.session_state.selected_tone,
-                purpose=st.session_state.selected_purpose,
-                post_format=st.session_state.selected_format,
-                char_limit=st.session_state.char_limit,
-                include_hashtags=st.session_state.include_hashtags,
-                hashtag_count=st.session_state.hashtag_count,
-                num_posts=st.session_state.num_posts
-            )
+            agent = get_shared_agent()
+            generation_key = get_generation_key()
+            result = st.session_state.generation_results.get(generation_key)
+            if result is None:
+                result = stream_post_previews(agent)
+                # Failures are kept too, so only "Generate New Variations" calls the model again
+                st.session_state.generation_results[generation_key] = result
+                if result["posts"] and not result["posts"][0].startswith("Error:"):
+                    st.session_state.celebrate_generation = True
+                    # Replace the previews with the full interactive post cards
+                    st.rerun()
             
             generated_posts = result["posts"]
             media_suggestions = result["media_suggestions"]
             character_counts = result["character_counts"]
 
-            if generated_posts and "Error" not in generated_posts[0]:
-                st.balloons()
+            if generated_posts and not generated_posts[0].startswith("Error:"):
+                if st.session_state.pop('celebrate_generation', False):
+                    st.balloons()
                 st.success(f"🎉 Successfully generated {len(generated_posts)} personalized post variations!")
                 
+                # Score every unscored draft with a single model call
+                if st.button("📊 Analyze All Posts", key="engage_all"):
+                    current_posts = [st.session_state.get(f"post_{i}", post) for i, post in enumerate(generated_posts)]
+                    pending_posts = [
+                        post for post in current_posts
+                        if get_post_digest(post) not in st.session_state.engagement_results
+                    ]
+                    if pending_posts:
+                        with st.spinner("📈 Scoring engagement potential for all posts..."):
+                            batch_results = agent.estimate_engagement_batch(pending_posts)
+                        for post, engagement_data in zip(pending_posts, batch_results):
+                            st.session_state.engagement_results[get_post_digest(post)] = engagement_data
+                
                 # Display posts
                 for i, (post, char_count) in enumerate(zip(generated_posts, character_counts)):
                     st.markdown(f"### 📝 Post Option {i+1}")
@@ -766,7 +859,7 @@ elif st.session_state.stage == 'generate':
                     """, unsafe_allow_html=True)
                     
                     # Post content
-                    st.text_area(
+                    edited_post = st.text_area(
                         f"Post Content {i+1}",
                         post,
                         height=250,
@@ -774,10 +867,18 @@ elif st.session_state.stage == 'generate':
                         label_visibility="collapsed"
                     )
                     
-                    # Engagement analysis
+                    # Engagement analysis (scored on request, memoized by post content)
                     with st.expander("📊 Engagement Potential Analysis"):
-                        engagement_data = agent.estimate_engagement_potential(post)
-                        display_engagement_metrics(engagement_data)
+                        post_digest = get_post_digest(edited_post)
+                        engagement_data = st.session_state.engagement_results.get(post_digest)
+                        if engagement_data is None and st.button("📊 Analyze Engagement", key=f"engage_{i}"):
+                            with st.spinner("📈 Scoring engagement potential..."):
+                                engagement_data = agent.estimate_engagement_potential(edited_post)
+                            st.session_state.engagement_results[post_digest] = engagement_data
+                        if engagement_data is not None:
+                            display_engagement_metrics(engagement_data)
+                        else:
+                            st.caption("Engagement scoring runs only when requested.")
                     
                     # Copy button (simulated)
                     col1, col2 = st.columns([3, 1])
@@ -799,7 +900,7 @@ elif st.session_state.stage == 'generate':
                         """, unsafe_allow_html=True)
 
             else:
-                st.error("❌ Sorry, something went wrong during post generation. Please try again.")
+                st.error("❌ Sorry, something went wrong during post generation. Click \"🔄 Generate New Variations\" to try again.")
 
         except Exception as e:
             st.error(f"❌ An error occurred: {e}")
@@ -814,8 +915,7 @@ elif st.session_state.stage == 'generate':
             st.rerun()
     
     with col2:
-        if st.button("🔄 Generate New Variations"):
-            st.rerun()
+        st.button("🔄 Generate New Variations", on_click=request_new_variations)
     
     with col3:
         if st.button("🔁 Start Over"):
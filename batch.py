@@ -0,0 +1,206 @@
+"""
+Headless batch generation for the LinkedIn Post Generator.
+Generates drafts for every combination of topics x tones x formats for one
+profile, a few combinations at a time, and appends each result to a JSONL
+file as soon as it is ready. The output file doubles as the checkpoint: a
+rerun with the same settings skips combinations already written. When the
+topics are recommended by the model, they are written to the file first (a
+"topics" record) and reused on rerun, since the model would pick new ones.
+
+Usage:
+    python batch.py resume.pdf --tones Professional Casual --formats "Story Format" "List Format" -o drafts.jsonl
+"""
+
+import argparse
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from resilience import RetryBudget, use_retry_budget
+from result_cache import make_cache_key
+
+DEFAULT_PURPOSE = "Educate the audience"
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+
+
+def load_profile(path: str) -> str:
+    """Reads profile text from a PDF resume or a plain-text file."""
+    if path.lower().endswith(".pdf"):
+        from pdf_extractor import extract_pdf_text
+
+        with open(path, "rb") as f:
+            text, metadata = extract_pdf_text(f)
+        if metadata["truncated"]:
+            print(f"Read the first {metadata['pages_read']} of {metadata['total_pages']} pages of {path}")
+        return text
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def build_matrix(topics: list[str], tones: list[str], formats: list[str]) -> list[dict]:
+    """Returns one job per topic x tone x format combination."""
+    return [
+        {"topic": topic, "tone": tone, "format": post_format}
+        for topic, tone, post_format in itertools.product(topics, tones, formats)
+    ]
+
+
+def job_key(profile_digest: str, job: dict, settings: dict) -> str:
+    """Identifies a job's result in the output file."""
+    return make_cache_key(profile_digest, job["topic"], job["tone"], job["format"], json.dumps(settings, sort_keys=True))
+
+
+def topics_key(profile_digest: str) -> str:
+    """Identifies a profile's recommended topics in the output file."""
+    return make_cache_key("topics", profile_digest)
+
+
+def read_records(output_path: str) -> dict:
+    """Returns the records already written to output_path, by key."""
+    records = {}
+    if not os.path.exists(output_path):
+        return records
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                records[record["key"]] = record
+            except (ValueError, KeyError, TypeError):
+                continue  # A line cut short by a crash is simply redone
+    return records
+
+
+def run_batch(profile_text: str, output_path: str, topics: list[str] | None = None, tones: list[str] = ("Professional",), formats: list[str] = ("Story Format",), purpose: str = DEFAULT_PURPOSE, char_limit: int = 1500, include_hashtags: bool = True, hashtag_count: int = 5, num_posts: int = 3, max_workers: int = BATCH_MAX_WORKERS, agent=None) -> dict:
+    """Generates posts for every topic x tone x format combination.
+
+    Without topics, the profile's five recommended topics are used (and
+    saved, so a rerun generates for the same topics); if the model gives no
+    usable topics, RuntimeError is raised before anything is written. Results
+    are appended to output_path as JSON lines; combinations already in the
+    file are skipped. Returns a summary with the number of jobs completed,
+    skipped and failed (failed jobs are not written, so a rerun retries
+    them), and how many of the failures only lacked media suggestions.
+    The whole profile shares one session's retry budget, as in the app.
+    """
+    if agent is None:
+        from ai_agent import get_shared_agent
+
+        agent = get_shared_agent()
+
+    profile_digest = hashlib.sha256(profile_text.encode("utf-8")).hexdigest()
+    records = read_records(output_path)
+    recommended = not topics
+    saved_topics = records.get(topics_key(profile_digest)) if recommended else None
+
+    retry_budget = RetryBudget()
+    if saved_topics:
+        # Topics chosen by an earlier run, so its finished jobs still match
+        analysis, topics = saved_topics["analysis"], saved_topics["topics"]
+    else:
+        with use_retry_budget(retry_budget):
+            if topics:
+                analysis = agent.analyze_profile(profile_text)
+            else:
+                # Default topics are not the model's answer, so they must not be saved for reruns
+                profile_result = agent.analyze_and_recommend(profile_text, default_topics=False)
+                analysis, topics = profile_result["analysis"], profile_result["topics"]
+    if analysis.startswith("Error:"):
+        raise RuntimeError("Could not analyze the profile; nothing was generated.")
+    if not topics:
+        raise RuntimeError("Could not recommend topics for the profile; nothing was generated.")
+
+    settings = {
+        "purpose": purpose, "char_limit": char_limit, "include_hashtags": include_hashtags,
+        "hashtag_count": hashtag_count, "num_posts": num_posts
+    }
+    matrix = build_matrix(topics, list(tones), list(formats))
+    for job in matrix:
+        job["key"] = job_key(profile_digest, job, settings)
+    done = set(records)
+    pending = [job for job in matrix if job["key"] not in done]
+
+    summary = {"total": len(matrix), "completed": 0, "skipped": len(matrix) - len(pending), "failed": 0, "media_fallback": 0}
+    write_lock = threading.Lock()
+
+    def run_job(job: dict) -> dict:
+        # Context variables do not follow work into the pool's threads
+        with use_retry_budget(retry_budget):
+            # No user is waiting, so media gets the whole deadline instead of a short grace period
+            result = agent.generate_posts(
+                job["topic"], analysis, job["tone"], purpose, job["format"],
+                char_limit, include_hashtags, hashtag_count, num_posts, media_grace=None
+            )
+        return {**job, **settings, "profile_digest": profile_digest, **result}
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "a", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if recommended and not saved_topics:
+            # Written before any job, so an interrupted run resumes with the same topics
+            output.write(json.dumps({
+                "key": topics_key(profile_digest), "record": "topics", "profile_digest": profile_digest,
+                "analysis": analysis, "topics": topics,
+                "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
+            }, ensure_ascii=False) + "\n")
+            output.flush()
+        futures = {executor.submit(run_job, job): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                print(f"Failed: {job['topic']} / {job['tone']} / {job['format']}: {e}")
+                summary["failed"] += 1
+                continue
+            # No posts at all (every fragment too short) is a failure too, as in the app
+            if not record["posts"] or record["posts"][0].startswith("Error:"):
+                print(f"Failed: {job['topic']} / {job['tone']} / {job['format']}")
+                summary["failed"] += 1
+                continue
+            if record.get("media_fallback"):
+                # Fallback media is not the model's answer; leaving the job out of the file makes a rerun redo it
+                print(f"Failed (no media suggestions): {job['topic']} / {job['tone']} / {job['format']}")
+                summary["failed"] += 1
+                summary["media_fallback"] += 1
+                continue
+
+            record["generated_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            with write_lock:
+                # One line per job, flushed right away, so a crash loses at most the jobs in flight
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+            summary["completed"] += 1
+            print(f"[{summary['completed'] + summary['skipped']}/{summary['total']}] {job['topic']} / {job['tone']} / {job['format']}")
+
+    return summary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate LinkedIn post drafts for a matrix of topics, tones and formats.")
+    parser.add_argument("profile", help="Resume PDF or text file")
+    parser.add_argument("-o", "--output", default="drafts.jsonl", help="JSONL file to append results to (also the checkpoint)")
+    parser.add_argument("--topics", nargs="+", help="Topics to write about (default: the profile's recommended topics)")
+    parser.add_argument("--tones", nargs="+", default=["Professional"])
+    parser.add_argument("--formats", nargs="+", default=["Story Format"])
+    parser.add_argument("--purpose", default=DEFAULT_PURPOSE)
+    parser.add_argument("--char-limit", type=int, default=1500)
+    parser.add_argument("--no-hashtags", action="store_true")
+    parser.add_argument("--hashtag-count", type=int, default=5)
+    parser.add_argument("--num-posts", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS, help="Jobs run in parallel")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(
+        load_profile(args.profile), args.output, topics=args.topics, tones=args.tones, formats=args.formats,
+        purpose=args.purpose, char_limit=args.char_limit, include_hashtags=not args.no_hashtags,
+        hashtag_count=args.hashtag_count, num_posts=args.num_posts, max_workers=args.workers
+    )
+    print(json.dumps(summary))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,250 @@
+"""
+End-to-end benchmark for the LinkedIn Post Generator agent.
+Drives the full pipeline (analyze -> recommend topics -> generate posts ->
+engagement scores) for a corpus of synthetic resumes against FakeBackend,
+so only the agent's own overhead and the simulated model latency are
+measured. Reports p50/p95/p99 per stage, model calls and tokens per session
+and sessions/sec at each concurrency level, and writes everything to a JSON
+file tagged with the git commit so runs can be compared across commits.
+
+Usage:
+    python benchmark.py --sessions 40 --concurrency 1 4 16 -o bench.json
+    python benchmark.py --compare baseline.json -o bench.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_backend import FakeBackend, lognormal_latency
+from resilience import CircuitBreaker
+
+STAGES = ("analyze", "recommend", "generate", "engagement")
+
+_FIRST_NAMES = ("Alex", "Priya", "Jordan", "Mei", "Omar", "Sofia", "Daniel", "Aisha", "Lucas", "Hana")
+_LAST_NAMES = ("Patel", "Nguyen", "Garcia", "Kim", "Okafor", "Rossi", "Schmidt", "Haddad", "Silva", "Tanaka")
+_ROLES = (
+    ("Software Engineer", "FinTech", ["Python", "distributed systems", "PostgreSQL", "Kubernetes", "API design"]),
+    ("Product Manager", "HealthTech", ["roadmapping", "user research", "A/B testing", "stakeholder management", "SQL"]),
+    ("Data Scientist", "E-commerce", ["machine learning", "forecasting", "experimentation", "Spark", "causal inference"]),
+    ("Marketing Lead", "SaaS", ["demand generation", "brand strategy", "content marketing", "SEO", "analytics"]),
+    ("Engineering Manager", "Logistics", ["team building", "hiring", "delivery planning", "mentoring", "system design"]),
+    ("UX Designer", "EdTech", ["interaction design", "prototyping", "accessibility", "design systems", "usability testing"]),
+)
+_LEVELS = (("Junior", 2), ("", 5), ("Senior", 9), ("Principal", 14))
+_COMPANIES = ("Northwind", "Globex", "Initech", "Umbrella Labs", "Stark Analytics", "Wayne Systems", "Acme Cloud")
+
+
+def synthetic_resume(index: int, seed: int = 0) -> str:
+    """Returns a plain-text resume that is unique and reproducible for (index, seed)."""
+    rng = random.Random(f"{seed}:{index}")
+    role, industry, skills = rng.choice(_ROLES)
+    level, years = rng.choice(_LEVELS)
+    title = f"{level} {role}".strip()
+    companies = rng.sample(_COMPANIES, 3)
+
+    lines = [
+        f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}",
+        f"{title} | {industry}",
+        "",
+        "Summary",
+        f"{title} with {years + index % 3} years of experience in {industry}, focused on {skills[0]} and {skills[1]}.",
+        "",
+        "Experience",
+    ]
+    for position, company in enumerate(companies):
+        start = 2024 - years + position * 2
+        lines.append(f"{title if position == 0 else role}, {company} ({start} - {'Present' if position == 0 else start + 2})")
+        for skill in rng.sample(skills, 3):
+            lines.append(f"- Led work on {skill}, improving a key metric by {rng.randint(5, 60)}% across {rng.randint(2, 12)} teams.")
+    lines += ["", "Skills", ", ".join(skills), "", "Education", f"B.Sc., State University ({2024 - years - 4})"]
+    return "\n".join(lines)
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(values: list[float]) -> dict:
+    """p50/p95/p99, mean and max in milliseconds."""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        **{f"p{q}": round(percentile(values, q) * 1000, 2) for q in (50, 95, 99)},
+        "mean": round(sum(values) / len(values) * 1000, 2),
+        "max": round(max(values) * 1000, 2)
+    }
+
+
+def run_session(agent, profile_text: str, fused: bool = False) -> dict:
+    """Runs one user's pipeline and returns seconds per stage reached (plus total and ok)."""
+    timings = {}
+    started = time.perf_counter()
+    try:
+        timings["ok"] = _run_stages(agent, profile_text, fused, timings)
+    except Exception as e:
+        # Errors the agent does not turn into fallbacks (e.g. an open circuit) fail the session
+        print(f"Session failed: {e!r}")
+        timings["ok"] = False
+    timings["total"] = time.perf_counter() - started
+    return timings
+
+
+def _run_stages(agent, profile_text: str, fused: bool, timings: dict) -> bool:
+    """Times each stage into timings; returns whether the session produced posts."""
+    stage_started = time.perf_counter()
+    if fused:
+        profile_result = agent.analyze_and_recommend(profile_text)
+        analysis, topics = profile_result["analysis"], profile_result["topics"]
+        timings["analyze_and_recommend"] = time.perf_counter() - stage_started
+    else:
+        analysis = agent.analyze_profile(profile_text)
+        timings["analyze"] = time.perf_counter() - stage_started
+        stage_started = time.perf_counter()
+        topics = agent.recommend_topics(analysis)
+        timings["recommend"] = time.perf_counter() - stage_started
+
+    # A failed analysis leaves nothing to write about; the session ends here
+    if analysis.startswith("Error:") or not topics:
+        return False
+
+    stage_started = time.perf_counter()
+    result = agent.generate_posts(topics[0], analysis, "Professional", "Educate the audience", "Story Format", 1500, True, 5, 3)
+    timings["generate"] = time.perf_counter() - stage_started
+
+    stage_started = time.perf_counter()
+    agent.estimate_engagement_batch(result["posts"])
+    timings["engagement"] = time.perf_counter() - stage_started
+
+    return not result["posts"][0].startswith("Error:")
+
+
+def run_level(concurrency: int, sessions: int, latency_ms: float, sigma: float, failure_rate: float, seed: int, fused: bool = False) -> dict:
+    """Runs sessions across concurrency threads with a fresh agent and backend."""
+    from ai_agent import PersonalizedPostAgent
+
+    backend = FakeBackend(latency=lognormal_latency(latency_ms / 1000, sigma), failure_rate=failure_rate, seed=seed)
+    agent = PersonalizedPostAgent(backend=backend)
+    # Measure the pipeline, not the API quota or results from earlier runs
+    agent.analysis_cache = None
+    agent.rate_limiter = None
+    agent.circuit_breaker = CircuitBreaker()
+
+    # Resumes differ per level so no level is served from another's work
+    profiles = [synthetic_resume(concurrency * 100000 + i, seed) for i in range(sessions)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda profile: run_session(agent, profile, fused), profiles))
+    wall = time.perf_counter() - started
+
+    stages = ("analyze_and_recommend",) + STAGES[2:] if fused else STAGES
+    calls = backend.calls
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "failed_sessions": sum(not result["ok"] for result in results),
+        "wall_seconds": round(wall, 3),
+        "sessions_per_second": round(sessions / wall, 3) if wall else None,
+        "stages": {stage: summarize([result[stage] for result in results if stage in result]) for stage in stages},
+        "session": summarize([result["total"] for result in results]),
+        "calls_per_session": round(len(calls) / sessions, 2),
+        "failed_calls": sum(call["failed"] for call in calls),
+        "prompt_tokens_per_session": round(sum(call["prompt_tokens"] for call in calls) / sessions, 1),
+        "output_tokens_per_session": round(sum(call["output_tokens"] for call in calls) / sessions, 1),
+        "structured_output": dict(agent.structured_output_stats)
+    }
+
+
+def git_commit() -> dict:
+    """Returns the checked-out commit and whether the tree has uncommitted changes."""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo, capture_output=True, text=True, check=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def compare(baseline: dict, current: dict) -> list[str]:
+    """Returns one line per concurrency level with throughput and p95 changes against baseline."""
+    def change(old, new):
+        return f"{(new - old) / old * 100:+.1f}%" if old and new is not None else "n/a"
+
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    lines = [f"vs {(baseline.get('commit') or 'unknown')[:12]}:"]
+    for level in current["levels"]:
+        old = previous.get(level["concurrency"])
+        if old is None:
+            continue
+        parts = [f"sessions/s {change(old['sessions_per_second'], level['sessions_per_second'])}"]
+        for stage, summary in level["stages"].items():
+            parts.append(f"{stage} p95 {change(old['stages'].get(stage, {}).get('p95'), summary.get('p95'))}")
+        parts.append(f"calls/session {change(old['calls_per_session'], level['calls_per_session'])}")
+        parts.append(f"tokens/session {change(old['prompt_tokens_per_session'], level['prompt_tokens_per_session'])}")
+        lines.append(f"  c={level['concurrency']}: " + ", ".join(parts))
+    return lines
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the agent pipeline against a simulated model backend.")
+    parser.add_argument("--sessions", type=int, default=20, help="Sessions (synthetic resumes) per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Median simulated model latency")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Spread of the log-normal latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of model calls failing with a 503")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fused", action="store_true", help="Analyze and recommend in one call, as the app does")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON file to write results to")
+    parser.add_argument("--compare", help="Earlier benchmark JSON to compare against")
+    args = parser.parse_args(argv)
+
+    report = {
+        **git_commit(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {
+            "sessions": args.sessions, "latency_ms": args.latency_ms, "sigma": args.sigma,
+            "failure_rate": args.failure_rate, "seed": args.seed, "fused": args.fused
+        },
+        "levels": []
+    }
+    try:
+        for concurrency in args.concurrency:
+            level = run_level(concurrency, args.sessions, args.latency_ms, args.sigma, args.failure_rate, args.seed, args.fused)
+            report["levels"].append(level)
+            # Stages no session reached (e.g. every analysis failed) have no percentiles
+            stages = ", ".join(
+                f"{stage} p50/p95/p99 {s['p50']}/{s['p95']}/{s['p99']}ms" if s["count"] else f"{stage} no samples"
+                for stage, s in level["stages"].items()
+            )
+            print(
+                f"c={concurrency}: {level['sessions_per_second']} sessions/s, {level['failed_sessions']} failed, {level['calls_per_session']} calls and "
+                f"{level['prompt_tokens_per_session']:.0f}+{level['output_tokens_per_session']:.0f} tokens per session; {stages}"
+            )
+    finally:
+        # Keep the levels measured so far even if a later one fails
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print("\n".join(compare(json.load(f), report)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,175 @@
+"""
+Reusable model contexts for the LinkedIn Post Generator agent.
+Prompts that repeat a large static part (the ghostwriting instructions plus a
+session's persona analysis, or the engagement rubric) send that part as a
+context and only the per-request delta as the prompt. GeminiContextCache
+stores contexts of at least the provider's minimum size with Gemini's
+cached-content API, so repeated calls transmit only the delta; smaller
+contexts are sent as a system instruction with every call. The posts and
+engagement contexts are a few hundred tokens, far below the 32768-token
+minimum for Gemini 1.5 models, so in this app the split is only structural
+and the full context is still sent each time; context caching is therefore
+off unless CONTEXT_CACHE is set. LocalContextCache is a stand-in that needs
+no API access, for tests and local runs.
+"""
+
+import abc
+import datetime
+import os
+import re
+import threading
+import time
+
+import google.generativeai as genai
+
+import instrumentation
+from result_cache import LRUCache, make_cache_key
+from single_flight import SingleFlight
+from text_processing import estimate_tokens
+
+# "gemini" (provider cache when possible), "local" (stand-in) or "off"
+CONTEXT_CACHE_MODE = os.getenv("CONTEXT_CACHE", "off")
+# Gemini 1.5 models reject cached contents smaller than this many tokens
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "32768"))
+CONTEXT_CACHE_TTL_SECONDS = float(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# Cached contents need a fixed model version; unversioned names get this suffix
+CONTEXT_CACHE_MODEL_VERSION = os.getenv("CONTEXT_CACHE_MODEL_VERSION", "001")
+
+
+def versioned_model_name(model_name: str, version: str = CONTEXT_CACHE_MODEL_VERSION) -> str:
+    """Returns model_name pinned to a version (e.g. gemini-1.5-flash -> gemini-1.5-flash-001)."""
+    if re.search(r"-\d{3}$", model_name):
+        return model_name
+    return f"{model_name}-{version}"
+
+
+class ContextCache(abc.ABC):
+    """Hands out models bound to a context, reusing them for repeated contexts."""
+
+    def __init__(self, max_entries: int = 128):
+        self._models = LRUCache(max_entries=max_entries, on_evict=lambda key, entry: self._release(entry))
+        # Concurrent misses for one context share a single creation
+        self._creating = SingleFlight()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def model_for(self, base_model, context: str):
+        """Returns a model that answers prompts with context already applied."""
+        key = make_cache_key(base_model.model_name, context)
+        model = self._cached_model(key)
+        if model is not None:
+            return model
+        return self._creating.do(key, lambda _: self._refresh(key, base_model, context))
+
+    def _cached_model(self, key: str):
+        entry = self._models.get(key)
+        if entry is None or self._expired(entry):
+            return None
+        self._count("hits")
+        instrumentation.record_cache("context", True)
+        return entry["model"]
+
+    def _refresh(self, key: str, base_model, context: str):
+        """Creates the model for key, replacing (and releasing) an expired one."""
+        # A caller that missed just before another finished creating it finds it here
+        model = self._cached_model(key)
+        if model is not None:
+            return model
+
+        self._count("misses")
+        instrumentation.record_cache("context", False)
+        model, handle = self._create(base_model, context)
+        previous = self._models.get(key)
+        self._models.set(key, {"model": model, "handle": handle, "created": time.monotonic()})
+        if previous is not None:
+            self._release(previous)
+        return model
+
+    @abc.abstractmethod
+    def _create(self, base_model, context: str) -> tuple:
+        """Returns a new model bound to context and a handle to release when it is dropped (or None)."""
+
+    def _release(self, entry: dict) -> None:
+        """Frees what an evicted or replaced entry holds on the provider's side."""
+
+    def _expired(self, entry: dict) -> bool:
+        return False
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            self.stats[outcome] += 1
+
+
+class _LocalContextModel:
+    """Model wrapper that prepends its context to every prompt."""
+
+    def __init__(self, base_model, context: str):
+        self.model_name = base_model.model_name
+        self._base_model = base_model
+        self._context = context
+
+    def generate_content(self, prompt: str, **kwargs):
+        return self._base_model.generate_content(f"{self._context}\n\n{prompt}", **kwargs)
+
+    async def generate_content_async(self, prompt: str, **kwargs):
+        return await self._base_model.generate_content_async(f"{self._context}\n\n{prompt}", **kwargs)
+
+
+class LocalContextCache(ContextCache):
+    """Stand-in for the provider cache: the context is sent inline with each prompt."""
+
+    def _create(self, base_model, context: str) -> tuple:
+        return _LocalContextModel(base_model, context), None
+
+
+class GeminiContextCache(ContextCache):
+    """Stores large contexts with Gemini's cached-content API.
+
+    Contexts under min_tokens, or ones the API refuses, fall back to a model
+    with the context as its system instruction. Cached contents are
+    recreated shortly before their TTL runs out, and deleted when they are
+    replaced or evicted, so they do not keep accruing storage until the TTL.
+    """
+
+    def __init__(self, max_entries: int = 128, min_tokens: int = CONTEXT_CACHE_MIN_TOKENS, ttl_seconds: float = CONTEXT_CACHE_TTL_SECONDS):
+        super().__init__(max_entries)
+        self.min_tokens = min_tokens
+        self.ttl_seconds = ttl_seconds
+        self.stats["provider_cached"] = 0
+
+    def _create(self, base_model, context: str):
+        if estimate_tokens(context) >= self.min_tokens:
+            try:
+                cached_content = genai.caching.CachedContent.create(
+                    model=versioned_model_name(base_model.model_name),
+                    system_instruction=context,
+                    ttl=datetime.timedelta(seconds=self.ttl_seconds)
+                )
+                self._count("provider_cached")
+                return genai.GenerativeModel.from_cached_content(cached_content), cached_content
+            except Exception as e:
+                print(f"Context caching unavailable, sending the context as a system instruction: {e}")
+        return genai.GenerativeModel(base_model.model_name, system_instruction=context), None
+
+    def _release(self, entry: dict) -> None:
+        cached_content = entry.get("handle")
+        if cached_content is None:
+            return
+        try:
+            cached_content.delete()
+        except Exception as e:
+            # It still expires at its TTL
+            print(f"Could not delete cached context: {e}")
+
+    def _expired(self, entry: dict) -> bool:
+        # Leave a margin so a request never lands on a just-expired cached content
+        return time.monotonic() - entry["created"] > self.ttl_seconds * 0.9
+
+
+def create_context_cache(mode: str = CONTEXT_CACHE_MODE) -> ContextCache | None:
+    """Returns the context cache for mode, or None when context caching is off."""
+    if mode == "off":
+        return None
+    if mode == "local":
+        return LocalContextCache()
+    return GeminiContextCache()
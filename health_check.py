@@ -1,121 +1,196 @@
 """
 Simple Health Check Server for LinkedIn Post Generator App
-Provides /health endpoint that returns 200 OK for deployment monitoring
+Provides /health endpoint that returns 200 OK for deployment monitoring,
+/ready that returns 503 while the model upstream or pipeline is unhealthy
+(from cached background probes, see readiness.py),
+/metrics with the agent's instrumentation in the Prometheus text format and
+/stats with live pipeline statistics (both populated when the server runs
+inside the app process; see start_health_server).
+Requests are served on their own threads over HTTP/1.1 keep-alive, idle or
+slow connections are dropped after HEALTH_REQUEST_TIMEOUT_SECONDS, and the
+/health and /status bodies are built once at startup.
 """
 
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import json
 import datetime
 import os
 import sys
+import threading
+
+import instrumentation
+import readiness
+
+# Run the health server on a background thread of the Streamlit app, so /metrics sees its model calls
+HEALTH_SERVER_IN_APP = os.getenv("HEALTH_SERVER_IN_APP", "false").lower() == "true"
+# Seconds a connection may sit idle (or take to send a request) before it is closed
+HEALTH_REQUEST_TIMEOUT_SECONDS = float(os.getenv("HEALTH_REQUEST_TIMEOUT_SECONDS", "5"))
+
+STARTED_AT = datetime.datetime.now().isoformat()
+
+ENDPOINTS = {
+    "/health": "Simple health check",
+    "/ready": "Readiness: upstream probe, circuit breaker, queue depth and error rate (503 when not ready)",
+    "/status": "Detailed service information",
+    "/metrics": "Model call and agent metrics (Prometheus format)",
+    "/stats": "Live pipeline statistics (rate limiter, circuit breaker, per-method latency)",
+    "/": "Service status"
+}
+
+JSON_TYPE = 'application/json'
+METRICS_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _json_body(payload):
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+# Nothing in these payloads changes while the process runs, so they are serialized once
+HEALTH_BODY = _json_body({
+    "status": "healthy",
+    "message": "AI LinkedIn Post Generator is running",
+    "started_at": STARTED_AT,
+    "service": "linkedin-post-generator"
+})
+
+STATUS_BODY = _json_body({
+    "status": "running",
+    "service": "AI LinkedIn Post Generator",
+    "version": "1.0.0",
+    "description": "Personalized LinkedIn post generation using AI",
+    "started_at": STARTED_AT,
+    "python_version": sys.version,
+    "environment": {
+        "GEMINI_API_KEY": "configured" if os.getenv("GEMINI_API_KEY") else "missing"
+    },
+    "features": [
+        "Profile analysis",
+        "Topic recommendations",
+        "Custom post generation",
+        "Character limit control",
+        "Hashtag management",
+        "Media suggestions",
+        "Engagement analysis"
+    ],
+    "endpoints": ENDPOINTS
+})
+
+
+def readiness_payload(pipeline_checks=True):
+    """Readiness report for /ready, built from cached probe results only"""
+    try:
+        return readiness.readiness_report(pipeline_checks)
+    except Exception as e:
+        return {"ready": False, "state": "not_ready", "reasons": [f"Readiness check unavailable: {e}"]}
+
+
+def pipeline_stats_payload():
+    """Live statistics for /stats: shared pipeline state plus per-method latency and recent spans"""
+    try:
+        from ai_agent import pipeline_stats
+        pipeline = pipeline_stats()
+    except Exception as e:
+        pipeline = {"error": f"Pipeline statistics unavailable: {e}"}
+
+    snapshot = instrumentation.metrics.snapshot()
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "pipeline": pipeline,
+        "operations": snapshot["histograms"].get("agent_operation_duration_seconds", []),
+        "model_calls": snapshot["histograms"].get("llm_call_duration_seconds", []),
+        "recent_spans": instrumentation.recent_spans(20)
+    }
+
 
 class HealthCheckHandler(BaseHTTPRequestHandler):
     """Handler for health check requests"""
-    
+
+    # Keep-alive, so load balancers and scrapers can reuse one connection
+    protocol_version = 'HTTP/1.1'
+    # Applied to the socket: bounds idle keep-alive connections and slow clients
+    timeout = HEALTH_REQUEST_TIMEOUT_SECONDS
+    # Buffer each response and send it in one segment, without waiting on Nagle/delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    # Probes and scrapes are too frequent to log one line each
+    QUIET_PATHS = ('/health', '/ready', '/metrics')
+
     def do_GET(self):
         """Handle GET requests"""
-        
-        if self.path == '/health':
-            self.send_health_response()
-        elif self.path == '/' or self.path == '/status':
-            self.send_status_response()
-        else:
-            self.send_404_response()
-    
+        self.send_body(*self.route())
+
     def do_HEAD(self):
         """Handle HEAD requests (for some monitoring systems)"""
-        if self.path in ['/health', '/', '/status']:
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-        else:
-            self.send_response(404)
-            self.end_headers()
-    
-    def send_health_response(self):
-        """Send health check response"""
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        
-        response = {
-            "status": "healthy",
-            "message": "AI LinkedIn Post Generator is running",
-            "timestamp": datetime.datetime.now().isoformat(),
-            "service": "linkedin-post-generator"
-        }
-        
-        self.wfile.write(json.dumps(response, indent=2).encode('utf-8'))
-    
-    def send_status_response(self):
-        """Send detailed status response"""
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
+        self.send_body(*self.route(), include_body=False)
+
+    def route(self):
+        """Return (status code, content type, body) for the requested path"""
+        path = self.path.split('?', 1)[0]
+        if path == '/health':
+            return 200, JSON_TYPE, HEALTH_BODY
+        if path == '/ready':
+            # A standalone server has no model traffic of its own to judge
+            report = readiness_payload(self.server.in_app)
+            return (200 if report["ready"] else 503), JSON_TYPE, _json_body(report)
+        if path == '/' or path == '/status':
+            return 200, JSON_TYPE, STATUS_BODY
+        if path == '/metrics':
+            return 200, METRICS_TYPE, instrumentation.metrics.render().encode('utf-8')
+        if path == '/stats':
+            return 200, JSON_TYPE, _json_body(pipeline_stats_payload())
+        return 404, JSON_TYPE, _json_body({
+            "error": "Not Found",
+            "message": f"Endpoint {path} not found",
+            "available_endpoints": list(ENDPOINTS)
+        })
+
+    def send_body(self, status, content_type, body, include_body=True):
+        """Send a complete response; Content-Length lets the client reuse the connection"""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'no-store')
         self.end_headers()
-        
-        # Check if required environment variables exist
-        env_status = {
-            "GEMINI_API_KEY": "configured" if os.getenv("GEMINI_API_KEY") else "missing"
-        }
-        
-        response = {
-            "status": "running",
-            "service": "AI LinkedIn Post Generator",
-            "version": "1.0.0",
-            "description": "Personalized LinkedIn post generation using AI",
-            "timestamp": datetime.datetime.now().isoformat(),
-            "python_version": sys.version,
-            "environment": env_status,
-            "features": [
-                "Profile analysis",
-                "Topic recommendations", 
-                "Custom post generation",
-                "Character limit control",
-                "Hashtag management",
-                "Media suggestions",
-                "Engagement analysis"
-            ],
-            "endpoints": {
-                "/health": "Simple health check",
-                "/status": "Detailed service information",
-                "/": "Service status"
-            }
-        }
-        
-        self.wfile.write(json.dumps(response, indent=2).encode('utf-8'))
-    
-    def send_404_response(self):
-        """Send 404 response for unknown endpoints"""
-        self.send_response(404)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        
-        response = {
-            "error": "Not Found",
-            "message": f"Endpoint {self.path} not found",
-            "available_endpoints": ["/health", "/status", "/"]
-        }
-        
-        self.wfile.write(json.dumps(response, indent=2).encode('utf-8'))
-    
+        if include_body:
+            self.wfile.write(body)
+
+    def log_request(self, code='-', size='-'):
+        """Log requests except successful probes and scrapes"""
+        if self.path.split('?', 1)[0] in self.QUIET_PATHS and str(code) == '200':
+            return
+        super().log_request(code, size)
+
     def log_message(self, format, *args):
         """Custom log format"""
         print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {format % args}")
 
 
+class HealthCheckServer(ThreadingHTTPServer):
+    """Serves each connection on its own daemon thread, so a slow client never blocks other probes"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+    # Set when the server runs inside the app process (see start_health_server)
+    in_app = False
+
+
 def run_health_server(port=8080):
     """Run the health check server"""
     server_address = ('', port)
-    httpd = HTTPServer(server_address, HealthCheckHandler)
-    
+    httpd = HealthCheckServer(server_address, HealthCheckHandler)
+
     print(f"🏥 Health Check Server starting on port {port}")
     print(f"📊 Health endpoint: http://localhost:{port}/health")
+    print(f"✅ Readiness endpoint: http://localhost:{port}/ready")
     print(f"📋 Status endpoint: http://localhost:{port}/status")
+    print(f"📈 Metrics endpoint: http://localhost:{port}/metrics")
+    print(f"🔎 Stats endpoint: http://localhost:{port}/stats")
     print(f"🏠 Homepage: http://localhost:{port}/")
     print("Press Ctrl+C to stop the server")
-    
+    readiness.get_probe()
+
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
@@ -123,7 +198,27 @@ def run_health_server(port=8080):
         httpd.server_close()
 
 
+_background_server = None
+_background_server_lock = threading.Lock()
+
+def start_health_server(port=8080):
+    """Start the health check server on a daemon thread, once per process"""
+    global _background_server
+    with _background_server_lock:
+        if _background_server is None:
+            try:
+                _background_server = HealthCheckServer(('', port), HealthCheckHandler)
+                _background_server.in_app = True
+            except OSError as e:
+                print(f"Health check server not started on port {port}: {e}")
+                return None
+            threading.Thread(target=_background_server.serve_forever, name="health-server", daemon=True).start()
+            readiness.get_probe()
+            print(f"🏥 Health Check Server running in-process on port {port}")
+        return _background_server
+
+
 if __name__ == '__main__':
     # Default port is 8080, but can be overridden via command line or environment
     port = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.environ.get('HEALTH_PORT', 8080))
-    run_health_server(port)
\ No newline at end of file
+    run_health_server(port)
@@ -0,0 +1,344 @@
+"""
+Instrumentation for the LinkedIn Post Generator agent.
+Public agent methods run inside an operation span and every model call inside
+a call span. Call spans carry the prompt template, input/output tokens from
+the response's usage metadata, latency, attempts (retries + 1) and whether
+the call was coalesced onto an identical in-flight request; operation spans
+record cache hits/misses and which fallback, if any, produced the result.
+Finished spans are aggregated into counters and histograms that
+health_check.py serves in the Prometheus text format at /metrics.
+"""
+
+import collections
+import contextlib
+import contextvars
+import functools
+import inspect
+import math
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+# Upper bounds of the token histogram buckets
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+# Finished spans kept for inspection
+RECENT_SPANS = 200
+
+_current_operation = contextvars.ContextVar("current_operation", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """Returns (le, count) pairs, ending with +Inf."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            pairs.append(("+Inf" if bound == math.inf else f"{bound:g}", total))
+        return pairs
+
+    def quantile(self, q: float) -> float | None:
+        """Estimates a quantile by linear interpolation within its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, seen = 0.0, 0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Thread-safe registry of labelled counters and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = collections.defaultdict(dict)
+        self._histograms = collections.defaultdict(dict)
+        self._buckets = {}
+
+    def counter(self, name: str, help_text: str) -> None:
+        self._help[name] = ("counter", help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS) -> None:
+        self._help[name] = ("histogram", help_text)
+        self._buckets[name] = buckets
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms[name]
+            if key not in series:
+                series[key] = Histogram(self._buckets.get(name, LATENCY_BUCKETS))
+            series[key].observe(value)
+
+    def snapshot(self) -> dict:
+        """Returns counters and histogram summaries (count, sum, p50/p95/p99) as plain dicts."""
+        with self._lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: [
+                    {
+                        "labels": dict(key), "count": h.count, "sum": round(h.sum, 6),
+                        **{f"p{int(q * 100)}": h.quantile(q) for q in (0.5, 0.95, 0.99)}
+                    }
+                    for key, h in series.items()
+                ]
+                for name, series in self._histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted(set(self._counters) | set(self._histograms)):
+                metric_type, help_text = self._help.get(name, ("counter" if name in self._counters else "histogram", ""))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for key, value in sorted(self._counters.get(name, {}).items()):
+                    lines.append(f"{name}{_labels(key)} {value:g}")
+                for key, h in sorted(self._histograms.get(name, {}).items()):
+                    for le, count in h.cumulative():
+                        lines.append(f"{name}_bucket{_labels(key + (('le', le),))} {count}")
+                    lines.append(f"{name}_sum{_labels(key)} {h.sum:g}")
+                    lines.append(f"{name}_count{_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key: tuple) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
+metrics.histogram("agent_operation_duration_seconds", "Latency of public agent methods")
+metrics.counter("agent_operations_total", "Agent method calls by outcome (ok, fallback or error)")
+metrics.counter("agent_fallbacks_total", "Results produced by a fallback instead of the model")
+metrics.counter("agent_cache_requests_total", "Cache lookups by cache and result (hit or miss)")
+metrics.histogram("llm_call_duration_seconds", "Latency of model calls, including retries and rate-limit waits")
+metrics.counter("llm_calls_total", "Model calls by outcome (ok, coalesced or error)")
+metrics.counter("llm_retries_total", "Retried model call attempts")
+metrics.counter("llm_tokens_total", "Model tokens by direction (input or output)")
+metrics.histogram("llm_call_tokens", "Input plus output tokens per model call", TOKEN_BUCKETS)
+
+_recent = collections.deque(maxlen=RECENT_SPANS)
+_recent_lock = threading.Lock()
+# (finish time, failed) of recent model calls, for windowed error rates
+_outcomes = collections.deque(maxlen=1000)
+
+
+class Span:
+    """One agent operation or model call."""
+
+    def __init__(self, kind: str, method: str | None, template: str | None = None):
+        self.kind = kind
+        self.method = method
+        self.template = template
+        self.started = time.monotonic()
+        self.latency = None
+        self.input_tokens = None
+        self.output_tokens = None
+        self.attempts = 0
+        self.cache = {}
+        self.fallback = None
+        self.cause = None  # Error that led to the fallback
+        self.error = None
+
+    def set_usage(self, usage) -> None:
+        """Takes token counts from a response's usage_metadata, if it has any."""
+        if usage is None:
+            return
+        self.input_tokens = getattr(usage, "prompt_token_count", None) or self.input_tokens
+        self.output_tokens = getattr(usage, "candidates_token_count", None) or self.output_tokens
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self.latency = time.monotonic() - self.started
+        if error is not None:
+            self.error = repr(error)
+        if self.kind == "call":
+            _record_call(self)
+        else:
+            _record_operation(self)
+        with _recent_lock:
+            _recent.append(self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind, "method": self.method, "template": self.template,
+            "latency": round(self.latency, 6) if self.latency is not None else None,
+            "input_tokens": self.input_tokens, "output_tokens": self.output_tokens,
+            "retries": max(0, self.attempts - 1), "coalesced": self.kind == "call" and self.attempts == 0 and self.error is None, "cache": self.cache, "fallback": self.fallback, "cause": self.cause, "error": self.error
+        }
+
+
+def _record_operation(span: Span) -> None:
+    outcome = "error" if span.error else "fallback" if span.fallback else "ok"
+    metrics.observe("agent_operation_duration_seconds", span.latency, method=span.method)
+    metrics.inc("agent_operations_total", method=span.method, outcome=outcome)
+
+
+def _record_call(span: Span) -> None:
+    labels = {"method": span.method or "", "template": span.template or ""}
+    # Coalesced calls made no request of their own, so their tokens are not counted again
+    outcome = "error" if span.error else "coalesced" if span.attempts == 0 else "ok"
+    metrics.observe("llm_call_duration_seconds", span.latency, **labels)
+    metrics.inc("llm_calls_total", outcome=outcome, **labels)
+    if outcome != "coalesced":
+        with _recent_lock:
+            _outcomes.append((time.monotonic(), outcome == "error"))
+    if span.attempts > 1:
+        metrics.inc("llm_retries_total", span.attempts - 1, **labels)
+    if outcome == "ok":
+        metrics.inc("llm_tokens_total", span.input_tokens or 0, direction="input", **labels)
+        metrics.inc("llm_tokens_total", span.output_tokens or 0, direction="output", **labels)
+        metrics.observe("llm_call_tokens", (span.input_tokens or 0) + (span.output_tokens or 0), **labels)
+
+
+@contextlib.contextmanager
+def operation(method: str):
+    """Runs the block as an operation span; model calls inside are attributed to it."""
+    span = Span("operation", method)
+    token = _current_operation.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.finish(e)
+        raise
+    else:
+        span.finish()
+    finally:
+        _current_operation.reset(token)
+
+
+def traced(fn):
+    """Decorator running each call of a (sync, async or generator) method as an operation span."""
+    method = fn.__name__
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with operation(method):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def generator_wrapper(*args, **kwargs):
+            # The span is only current while the generator runs, not between items
+            span = Span("operation", method)
+            generator = fn(*args, **kwargs)
+            error = None
+            try:
+                while True:
+                    token = _current_operation.set(span)
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        _current_operation.reset(token)
+                    yield item
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                generator.close()
+                span.finish(None if isinstance(error, GeneratorExit) else error)
+        return generator_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with operation(method):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def start_call(template: str | None) -> Span:
+    """Starts a model call span for the current operation; the caller finishes it."""
+    operation_span = _current_operation.get()
+    return Span("call", operation_span.method if operation_span else None, template)
+
+
+def traced_stream(chunks, span: Span):
+    """Yields the chunks of a streamed response, finishing span when the stream ends."""
+    try:
+        for chunk in chunks:
+            span.set_usage(getattr(chunk, "usage_metadata", None))
+            yield chunk
+    except BaseException as e:
+        span.finish(None if isinstance(e, GeneratorExit) else e)
+        raise
+    span.finish()
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Counts a cache lookup and notes it on the current operation."""
+    result = "hit" if hit else "miss"
+    metrics.inc("agent_cache_requests_total", cache=cache, result=result)
+    operation_span = _current_operation.get()
+    if operation_span is not None:
+        operation_span.cache[cache] = result
+
+
+def record_fallback(fallback: str, error: BaseException | None = None) -> None:
+    """Counts a result produced by a fallback and notes it (and its cause) on the current operation."""
+    operation_span = _current_operation.get()
+    method = operation_span.method if operation_span else ""
+    metrics.inc("agent_fallbacks_total", method=method, fallback=fallback)
+    if operation_span is not None:
+        operation_span.fallback = fallback
+        if error is not None:
+            operation_span.cause = repr(error)
+
+
+def recent_spans(limit: int = RECENT_SPANS) -> list[dict]:
+    """Returns up to limit of the most recently finished spans, newest last."""
+    with _recent_lock:
+        return list(_recent)[-limit:]
+
+
+def call_error_rate(window_seconds: float) -> dict:
+    """Returns model calls, failed calls and their ratio over the last window_seconds."""
+    since = time.monotonic() - window_seconds
+    with _recent_lock:
+        recent = [failed for finished, failed in _outcomes if finished >= since]
+    errors = sum(recent)
+    return {"calls": len(recent), "errors": errors, "error_rate": errors / len(recent) if recent else None}
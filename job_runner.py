@@ -0,0 +1,337 @@
+"""
+Resumable batch jobs over many profiles.
+Each profile is processed as a chain of units: persona analysis, topic
+recommendations, one posts unit per topic x tone x format, and optionally
+engagement scoring for each posts unit. Every finished unit is appended to a
+journal (a JSONL file that is only ever appended to and fsynced per entry).
+A rerun with the same journal replays it and only does the units that are
+missing, and analyses already in the agent's result cache cost no model call.
+
+Usage:
+    python job_runner.py profiles/*.pdf --journal run.journal --tones Professional Casual --engagement
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from batch import BATCH_MAX_WORKERS, DEFAULT_PURPOSE, build_matrix, load_profile
+from resilience import RetryBudget, use_retry_budget
+from result_cache import make_cache_key
+
+# Consecutive failed units after which the run stops (e.g. the quota is exhausted)
+MAX_CONSECUTIVE_FAILURES = int(os.getenv("JOB_MAX_CONSECUTIVE_FAILURES", "5"))
+
+UNITS = ("analysis", "topics", "posts", "engagement")
+
+
+class JobAborted(RuntimeError):
+    """Raised inside workers once the run has been stopped."""
+
+
+class Journal:
+    """Append-only JSONL log of finished (and failed) units.
+
+    Only "done" entries count on replay; failed units are logged for
+    diagnosis and redone on the next run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._results = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # An entry cut short by a crash is simply redone
+                    if entry.get("status") == "done":
+                        self._results[entry["key"]] = entry["result"]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def get(self, key: str):
+        with self._lock:
+            return self._results.get(key)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._results
+
+    def record(self, key: str, unit: str, profile: str, status: str, result=None, **fields) -> None:
+        entry = {
+            "key": key, "unit": unit, "profile": profile, "status": status, "result": result, **fields,
+            "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
+        }
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if status == "done":
+                self._results[key] = result
+
+    def entries(self):
+        """Yields every entry in the journal file, oldest first."""
+        with self._lock:
+            self._file.flush()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class JobRunner:
+    """Runs profile x topic x tone x format jobs, journaling every unit."""
+
+    def __init__(self, journal_path: str, agent=None, max_workers: int = BATCH_MAX_WORKERS, max_consecutive_failures: int = MAX_CONSECUTIVE_FAILURES):
+        if agent is None:
+            from ai_agent import get_shared_agent
+
+            agent = get_shared_agent()
+        self.agent = agent
+        self.journal = Journal(journal_path)
+        self.max_workers = max_workers
+        self.max_consecutive_failures = max_consecutive_failures
+        self._stats_lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._aborted = threading.Event()
+        self.stats = {unit: {"done": 0, "journaled": 0, "cached": 0, "failed": 0} for unit in UNITS}
+        # Posts units that failed only because the media suggestions fell back
+        self.stats["posts"]["media_fallback"] = 0
+
+    def run(self, profile_paths: list[str], topics: list[str] | None = None, tones: list[str] = ("Professional",), formats: list[str] = ("Story Format",), purpose: str = DEFAULT_PURPOSE, char_limit: int = 1500, include_hashtags: bool = True, hashtag_count: int = 5, num_posts: int = 3, engagement: bool = False) -> dict:
+        """Processes every profile, skipping units already in the journal.
+
+        Returns per-unit counts of units done now, replayed from the journal,
+        served from the result cache and failed (and, for posts, how many
+        failed only for lack of media suggestions), plus whether the run was
+        stopped early after too many consecutive failures.
+        """
+        settings = {
+            "purpose": purpose, "char_limit": char_limit, "include_hashtags": include_hashtags,
+            "hashtag_count": hashtag_count, "num_posts": num_posts
+        }
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._run_profile, path, topics, list(tones), list(formats), settings, engagement): path
+                for path in profile_paths
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except JobAborted:
+                    pass
+                except Exception as e:
+                    print(f"Failed: {futures[future]}: {e}")
+        return {"units": self.stats, "aborted": self._aborted.is_set()}
+
+    def _run_profile(self, path: str, topics: list[str] | None, tones: list[str], formats: list[str], settings: dict, engagement: bool) -> None:
+        # Each profile's chain of units spends one session's retry budget, as in the app
+        with use_retry_budget(RetryBudget()):
+            self._run_units(path, topics, tones, formats, settings, engagement)
+
+    def _run_units(self, path: str, topics: list[str] | None, tones: list[str], formats: list[str], settings: dict, engagement: bool) -> None:
+        profile_text = load_profile(path)
+        digest = hashlib.sha256(profile_text.encode("utf-8")).hexdigest()
+
+        analysis, fused_topics = self._analysis_unit(path, digest, profile_text, recommend=not topics)
+        if analysis is None:
+            return
+        if not topics:
+            topics = fused_topics or self._unit("topics", make_cache_key("topics", digest), path, lambda: self._recommend_topics(analysis))
+            if not topics:
+                return
+
+        for job in build_matrix(topics, tones, formats):
+            posts_key = make_cache_key("posts", digest, job["topic"], job["tone"], job["format"], json.dumps(settings, sort_keys=True))
+            result = self._unit(
+                "posts", posts_key, path,
+                lambda job=job: self._generate(analysis, job, settings),
+                **job
+            )
+            if result is not None and engagement:
+                self._unit(
+                    "engagement", make_cache_key("engagement", posts_key), path,
+                    lambda result=result: self.agent.estimate_engagement_batch(result["posts"], heuristic_fallback=False),
+                    posts_key=posts_key
+                )
+
+    def _analysis_unit(self, path: str, digest: str, profile_text: str, recommend: bool) -> tuple[str | None, list[str] | None]:
+        """Runs the analysis unit, fusing it with the topics unit when both are needed.
+
+        Returns the analysis (None on failure) and the topics if they came from the fused call.
+        """
+        analysis_key = make_cache_key("analysis", digest)
+        topics_key = make_cache_key("topics", digest)
+        if analysis_key in self.journal:
+            self._count("analysis", "journaled")
+            return self.journal.get(analysis_key), None
+
+        cached = self.agent.cached_analysis(profile_text)
+        if cached is not None:
+            self._count("analysis", "cached")
+            self.journal.record(analysis_key, "analysis", path, "done", cached, source="cache")
+            return cached, None
+
+        if not recommend or topics_key in self.journal:
+            return self._unit("analysis", analysis_key, path, lambda: self.agent.analyze_profile(profile_text)), None
+
+        # One model call for both units
+        fused = {}
+
+        def analyze_and_recommend():
+            # Without default topics, so a failed topics half is redone as its own unit
+            fused.update(self.agent.analyze_and_recommend(profile_text, default_topics=False))
+            return fused["analysis"]
+
+        analysis = self._unit("analysis", analysis_key, path, analyze_and_recommend)
+        if analysis is None or not fused.get("topics"):
+            return analysis, None
+        self.journal.record(topics_key, "topics", path, "done", fused["topics"])
+        self._count("topics", "done")
+        return analysis, fused["topics"]
+
+    def _recommend_topics(self, analysis: str) -> list[str]:
+        # Default topics are not the model's answer, so they must not be journaled as done
+        topics = self.agent.recommend_topics(analysis, default_topics=False)
+        if not topics:
+            raise ValueError("No topics recommended")
+        return topics
+
+    def _generate(self, analysis: str, job: dict, settings: dict) -> dict:
+        # No user is waiting, so media gets the whole deadline instead of a short grace period
+        result = self.agent.generate_posts(
+            job["topic"], analysis, job["tone"], settings["purpose"], job["format"],
+            settings["char_limit"], settings["include_hashtags"], settings["hashtag_count"], settings["num_posts"],
+            media_grace=None
+        )
+        # Fallback media is not the model's answer, so the unit fails and a rerun redoes it
+        if result.get("media_fallback") and not _error_in(result):
+            with self._stats_lock:
+                self.stats["posts"]["media_fallback"] += 1
+            raise ValueError("No media suggestions from the model")
+        return result
+
+    def _unit(self, unit: str, key: str, path: str, work, **fields):
+        """Returns the journaled result for key, or does the work and journals it.
+
+        Returns None if the work failed. The agent reports failures as
+        "Error: ..." text rather than exceptions, so both count as failures;
+        fallback results (default topics, heuristic engagement scores) are
+        turned off for job units so they fail here instead.
+        """
+        if key in self.journal:
+            self._count(unit, "journaled")
+            return self.journal.get(key)
+        if self._aborted.is_set():
+            raise JobAborted()
+
+        try:
+            result = work()
+            error = _error_in(result)
+        except Exception as e:
+            result, error = None, str(e)
+
+        if error:
+            self.journal.record(key, unit, path, "failed", error=error, **fields)
+            self._count(unit, "failed")
+            print(f"Failed {unit} for {path}: {error}")
+            return None
+        self.journal.record(key, unit, path, "done", result, **fields)
+        self._count(unit, "done")
+        return result
+
+    def _count(self, unit: str, outcome: str) -> None:
+        with self._stats_lock:
+            self.stats[unit][outcome] += 1
+            if outcome == "failed":
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.max_consecutive_failures and not self._aborted.is_set():
+                    print(f"Stopping after {self._consecutive_failures} consecutive failures; rerun to resume.")
+                    self._aborted.set()
+            elif outcome == "done":
+                self._consecutive_failures = 0
+
+    def results(self):
+        """Yields every journaled posts result (with its engagement scores when available)."""
+        engagement = {}
+        posts = []
+        for entry in self.journal.entries():
+            if entry["status"] != "done":
+                continue
+            if entry["unit"] == "posts":
+                posts.append(entry)
+            elif entry["unit"] == "engagement":
+                engagement[entry["posts_key"]] = entry["result"]
+        for entry in posts:
+            yield {
+                "profile": entry["profile"], "topic": entry["topic"], "tone": entry["tone"], "format": entry["format"],
+                **entry["result"], "engagement": engagement.get(entry["key"])
+            }
+
+    def close(self) -> None:
+        self.journal.close()
+
+
+def _error_in(result) -> str | None:
+    """Returns the agent's error text if result is one of its failure values."""
+    if isinstance(result, str) and result.startswith("Error:"):
+        return result
+    if isinstance(result, dict) and "posts" in result:
+        # No posts at all (every fragment too short) is a failure too, as in the app
+        if not result["posts"]:
+            return "No posts generated"
+        if str(result["posts"][0]).startswith("Error:"):
+            return result["posts"][0]
+    return None
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Resumable batch generation over many profiles.")
+    parser.add_argument("profiles", nargs="+", help="Resume PDFs or text files")
+    parser.add_argument("--journal", default="jobs.journal", help="Append-only journal used to resume the run")
+    parser.add_argument("--export", help="Write the journaled posts to this JSONL file when done")
+    parser.add_argument("--topics", nargs="+", help="Topics to write about (default: each profile's recommended topics)")
+    parser.add_argument("--tones", nargs="+", default=["Professional"])
+    parser.add_argument("--formats", nargs="+", default=["Story Format"])
+    parser.add_argument("--purpose", default=DEFAULT_PURPOSE)
+    parser.add_argument("--char-limit", type=int, default=1500)
+    parser.add_argument("--no-hashtags", action="store_true")
+    parser.add_argument("--hashtag-count", type=int, default=5)
+    parser.add_argument("--num-posts", type=int, default=3)
+    parser.add_argument("--engagement", action="store_true", help="Also score each set of posts")
+    parser.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS, help="Profiles processed in parallel")
+    args = parser.parse_args(argv)
+
+    runner = JobRunner(args.journal, max_workers=args.workers)
+    try:
+        summary = runner.run(
+            args.profiles, topics=args.topics, tones=args.tones, formats=args.formats, purpose=args.purpose,
+            char_limit=args.char_limit, include_hashtags=not args.no_hashtags, hashtag_count=args.hashtag_count,
+            num_posts=args.num_posts, engagement=args.engagement
+        )
+        if args.export:
+            with open(args.export, "w", encoding="utf-8") as f:
+                for record in runner.results():
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        runner.close()
+    print(json.dumps(summary))
+    failed = any(counts["failed"] for counts in summary["units"].values())
+    return 1 if failed or summary["aborted"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,281 @@
+"""
+Model backends for the LinkedIn Post Generator agent.
+The agent talks to the model only through the LLMBackend protocol, so the
+Gemini client can be swapped for FakeBackend: an in-process, network-free
+backend with scripted responses, configurable latency distributions and
+failure rates, for tests, load tests and benchmarks. FakeBackend output is
+deterministic for a given seed and prompt.
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Iterator, Protocol
+
+from text_processing import estimate_tokens
+
+# "gemini" or "fake" (no network; for load-testing the app)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+# Median latency and failure rate of the fake backend when selected via LLM_BACKEND
+FAKE_LLM_LATENCY_SECONDS = float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "1.0"))
+FAKE_LLM_FAILURE_RATE = float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+
+
+class LLMBackend(Protocol):
+    """What the agent needs from a model provider.
+
+    context is static text the prompt builds on; backends may cache it
+    server-side. Responses (and stream chunks) expose .text and, where the
+    provider reports it, .usage_metadata with token counts.
+    """
+
+    model_name: str
+
+    def generate(self, prompt: str, context: str | None = None, generation_config: dict | None = None, timeout: float | None = None): ...
+
+    def stream(self, prompt: str, context: str | None = None, generation_config: dict | None = None, timeout: float | None = None) -> Iterator: ...
+
+    async def generate_async(self, prompt: str, context: str | None = None, generation_config: dict | None = None, timeout: float | None = None): ...
+
+    def count_tokens(self, text: str, timeout: float | None = None) -> int: ...
+
+
+class GeminiBackend:
+    """LLMBackend for Google's Gemini API via google-generativeai."""
+
+    def __init__(self, model_name: str, api_key: str | None = None, context_cache=None):
+        # Imported here so the fake backend works without the Gemini SDK installed
+        import google.generativeai as genai
+        from context_cache import create_context_cache
+
+        if api_key:
+            genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+        self.context_cache = context_cache if context_cache is not None else create_context_cache()
+
+    def _bind_context(self, prompt: str, context: str | None) -> tuple:
+        """Returns the model and prompt to send; without a context cache the context is sent inline."""
+        if context is None:
+            return self.model, prompt
+        if self.context_cache is None:
+            return self.model, f"{context}\n\n{prompt}"
+        return self.context_cache.model_for(self.model, context), prompt
+
+    @staticmethod
+    def _request_options(timeout: float | None) -> dict:
+        return {"timeout": timeout} if timeout else {}
+
+    def generate(self, prompt: str, context: str | None = None, generation_config: dict | None = None, timeout: float | None = None):
+        model, prompt = self._bind_context(prompt, context)
+        return model.generate_content(prompt, generation_config=generation_config, request_options=self._request_options(timeout))
+
+    def stream(self, prompt: str, context: str | None = None, generation_config: dict | None = None, timeout: float | None = None):
+        model, prompt = self._bind_context(prompt, context)
+        return model.generate_content(prompt, stream=True, generation_config=generation_config, request_options=self._request_options(timeout))
+
+    async def generate_async(self, prompt: str, context: str | None = None, generation_config: dict | None = None, timeout: float | None = None):
+        model, prompt = self._bind_context(prompt, context)
+        return await model.generate_content_async(prompt, generation_config=generation_config, request_options=self._request_options(timeout))
+
+    def count_tokens(self, text: str, timeout: float | None = None) -> int:
+        return self.model.count_tokens(text, request_options=self._request_options(timeout)).total_tokens
+
+
+# --- Fake backend ---
+
+def constant_latency(seconds: float):
+    return lambda rng: seconds
+
+
+def uniform_latency(low: float, high: float):
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal_latency(median: float, sigma: float = 0.5):
+    """Right-skewed latencies like real model calls: most near median, a long tail."""
+    return lambda rng: rng.lognormvariate(math.log(median), sigma)
+
+
+class FakeBackendError(Exception):
+    """Injected failure; .code mirrors the HTTP status of the upstream error it imitates."""
+
+    def __init__(self, message: str, code: int = 503):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeResponse:
+    """Response (or stream chunk) shaped like Gemini's: .text and .usage_metadata."""
+
+    def __init__(self, text: str, prompt_tokens: int = 0, output_tokens: int | None = None):
+        self.text = text
+        output_tokens = estimate_tokens(text) if output_tokens is None else output_tokens
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens
+        )
+
+
+_WORDS = (
+    "team growth data product customers lessons leadership engineering strategy insight culture "
+    "career learning impact results scale quality trust feedback mentoring launch roadmap metrics "
+    "collaboration innovation experience challenge solution process delivery community"
+).split()
+
+
+class FakeBackend:
+    """Network-free LLMBackend with scripted responses, latency and failures.
+
+    responses maps a regex to the text to return for prompts (context plus
+    prompt) matching it; the value may also be a callable taking
+    (prompt, context, generation_config). Unmatched prompts get a response
+    synthesized from the request: JSON matching the response schema, posts
+    separated by the post separator, or a plain-text persona summary.
+    latency is a callable taking a random.Random and returning seconds;
+    failure_rate is the probability of raising FakeBackendError with one of
+    failure_codes.
+    """
+
+    def __init__(self, responses: dict | None = None, latency=None, failure_rate: float = 0.0, failure_codes: tuple = (503,), seed: int = 0, model_name: str = "fake-model", stream_chunks: int = 8):
+        self.model_name = model_name
+        self.responses = [(re.compile(pattern, re.DOTALL), response) for pattern, response in (responses or {}).items()]
+        self.latency = latency or constant_latency(0.0)
+        self.failure_rate = failure_rate
+        self.failure_codes = failure_codes
+        self.seed = seed
+        self.stream_chunks = stream_chunks
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = []
+
+    # Latency and failures come from one seeded stream shared by all callers
+    def _draw(self) -> tuple[float, int | None]:
+        with self._lock:
+            latency = max(0.0, self.latency(self._rng))
+            failed = self._rng.random() < self.failure_rate
+            code = self._rng.choice(self.failure_codes) if failed else None
+        return latency, code
+
+    def _record(self, kind: str, prompt: str, context: str | None, text: str | None, latency: float, code: int | None) -> None:
+        with self._lock:
+            self.calls.append({
+                "kind": kind, "prompt_tokens": estimate_tokens(prompt) + estimate_tokens(context or ""),
+                "output_tokens": estimate_tokens(text or ""), "latency": latency, "failed": code is not None
+            })
+
+    def _respond(self, kind: str, prompt: str, context: str | None, generation_config: dict | None, timeout: float | None):
+        """Returns (text, latency, error) for one call; the caller does the waiting."""
+        latency, code = self._draw()
+        if timeout is not None and latency > timeout:
+            self._record(kind, prompt, context, None, timeout, 504)
+            return None, timeout, TimeoutError(f"Fake request exceeded its {timeout:.1f}s timeout")
+        if code is not None:
+            self._record(kind, prompt, context, None, latency, code)
+            return None, latency, FakeBackendError(f"Injected upstream failure ({code})", code)
+        text = self._script(prompt, context, generation_config)
+        self._record(kind, prompt, context, text, latency, None)
+        return text, latency, None
+
+    def generate(self, prompt: str, context: str | None = None, generation_config: dict | None = None, timeout: float | None = None):
+        text, latency, error = self._respond("generate", prompt, context, generation_config, timeout)
+        time.sleep(latency)
+        if error:
+            raise error
+        return FakeResponse(text, estimate_tokens(prompt) + estimate_tokens(context or ""))
+
+    def stream(self, prompt: str, context: str | None = None, generation_config: dict | None = None, timeout: float | None = None):
+        text, latency, error = self._respond("stream", prompt, context, generation_config, timeout)
+        # Like the real client, the first chunk arrives after most of the latency
+        time.sleep(latency * 0.5)
+        if error:
+            raise error
+        return self._chunks(text, estimate_tokens(prompt) + estimate_tokens(context or ""), latency * 0.5)
+
+    def _chunks(self, text: str, prompt_tokens: int, duration: float):
+        size = max(1, math.ceil(len(text) / self.stream_chunks))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        # Like Gemini, each chunk's usage covers the response so far
+        sent = ""
+        for piece in pieces:
+            sent += piece
+            yield FakeResponse(piece, prompt_tokens, estimate_tokens(sent))
+            time.sleep(duration / len(pieces))
+
+    async def generate_async(self, prompt: str, context: str | None = None, generation_config: dict | None = None, timeout: float | None = None):
+        text, latency, error = self._respond("generate_async", prompt, context, generation_config, timeout)
+        await asyncio.sleep(latency)
+        if error:
+            raise error
+        return FakeResponse(text, estimate_tokens(prompt) + estimate_tokens(context or ""))
+
+    def count_tokens(self, text: str, timeout: float | None = None) -> int:
+        return estimate_tokens(text)
+
+    def _script(self, prompt: str, context: str | None, generation_config: dict | None) -> str:
+        full_prompt = f"{context}\n\n{prompt}" if context else prompt
+        for pattern, response in self.responses:
+            if pattern.search(full_prompt):
+                return response(prompt, context, generation_config) if callable(response) else response
+
+        # Content depends only on the seed and the request, never on call order
+        rng = random.Random(f"{self.seed}:{full_prompt}")
+        schema = (generation_config or {}).get("response_schema")
+        if schema:
+            return json.dumps(_sample(schema, rng, _requested_count(prompt)))
+        separator = re.search(r"exactly this text: (\S+)", prompt)
+        if separator:
+            count = _requested_count(prompt) or 3
+            return f"\n{separator.group(1)}\n".join(_sentence(rng, 40, 80) for _ in range(count))
+        return _sentence(rng, 60, 110)
+
+
+def _requested_count(prompt: str) -> int | None:
+    """Finds how many items the prompt asks for (posts or scored posts)."""
+    match = re.search(r"(?:Generate|exactly) (\d+)", prompt)
+    return int(match.group(1)) if match else None
+
+
+def _sentence(rng: random.Random, min_words: int, max_words: int) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def _sample(schema: dict, rng: random.Random, count: int | None):
+    """Builds a value matching a response schema."""
+    schema_type = schema.get("type")
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if schema_type == "object":
+        return {name: _sample(property_schema, rng, count) for name, property_schema in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        items = schema.get("items", {})
+        # Lists of plain strings are topics or posts; use the requested count when the prompt gives one
+        length = count or (5 if items.get("type") == "string" else 3)
+        return [_sample(items, rng, None) for _ in range(length)]
+    if schema_type == "integer":
+        return rng.randint(schema.get("minimum", 1), schema.get("maximum", 5))
+    if schema_type == "number":
+        return round(rng.uniform(0, 1), 3)
+    if schema_type == "boolean":
+        return rng.random() < 0.5
+    return _sentence(rng, 12, 60)
+
+
+def create_backend(model_name: str, kind: str = LLM_BACKEND):
+    """Returns the backend selected by kind; the Gemini backend requires GEMINI_API_KEY."""
+    if kind == "fake":
+        return FakeBackend(latency=lognormal_latency(FAKE_LLM_LATENCY_SECONDS), failure_rate=FAKE_LLM_FAILURE_RATE)
+    if kind != "gemini":
+        raise ValueError(f"Unknown LLM_BACKEND '{kind}'; expected 'gemini' or 'fake'.")
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found. Please set it in your .env file.")
+    return GeminiBackend(model_name, api_key=api_key)
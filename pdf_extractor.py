@@ -0,0 +1,104 @@
+"""
+Incremental PDF text extraction for uploaded resumes.
+Pages are parsed one at a time and extraction stops as soon as the page,
+character or time budget is spent, so oversized or image-heavy PDFs cannot
+hold a worker for long. The persona analysis only needs the first few pages.
+"""
+
+import hashlib
+import os
+import time
+from io import BytesIO
+
+import PyPDF2
+
+from result_cache import LRUCache
+from text_processing import PAGE_BREAK
+
+# Extraction budgets (override via environment variables)
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "10"))
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "30000"))
+PDF_MAX_SECONDS = float(os.getenv("PDF_MAX_SECONDS", "10"))
+# Number of extracted documents kept in memory, shared by all sessions
+PDF_TEXT_CACHE_SIZE = int(os.getenv("PDF_TEXT_CACHE_SIZE", "256"))
+
+_text_cache = LRUCache(max_entries=PDF_TEXT_CACHE_SIZE)
+
+
+def iter_page_text(file, max_pages: int = PDF_MAX_PAGES, max_chars: int = PDF_MAX_CHARS, max_seconds: float = PDF_MAX_SECONDS):
+    """Yields (page_number, text, seconds) for each page until a budget is spent.
+
+    page_number is 1-based and seconds is the time spent extracting that page.
+    The last page is cut short if it would exceed max_chars. The time budget
+    is checked between pages, since PyPDF2 cannot interrupt a page mid-parse.
+    """
+    for page_number, text, seconds, _ in _iter_reader_pages(PyPDF2.PdfReader(file), max_pages, max_chars, max_seconds):
+        yield page_number, text, seconds
+
+
+def _iter_reader_pages(pdf_reader, max_pages: int, max_chars: int, max_seconds: float):
+    """Yields (page_number, text, seconds, cut) per page; cut is True if the page text was shortened."""
+    started = time.perf_counter()
+    chars_left = max_chars
+
+    for index, page in enumerate(pdf_reader.pages):
+        if index >= max_pages or chars_left <= 0 or time.perf_counter() - started >= max_seconds:
+            return
+        page_started = time.perf_counter()
+        text = page.extract_text() or ""
+        cut = len(text) > chars_left
+        text = text[:chars_left]
+        chars_left -= len(text)
+        yield index + 1, text, time.perf_counter() - page_started, cut
+
+
+def extract_pdf_text(file, max_pages: int = PDF_MAX_PAGES, max_chars: int = PDF_MAX_CHARS, max_seconds: float = PDF_MAX_SECONDS) -> tuple[str, dict]:
+    """Extracts text from a PDF within the given budgets.
+
+    Returns the text and a metadata dict with page counts, per-page timings
+    and whether any part of the document was skipped.
+    """
+    started = time.perf_counter()
+    pdf_reader = PyPDF2.PdfReader(file)
+    total_pages = len(pdf_reader.pages)
+
+    parts = []
+    page_timings = []
+    page_cut = False
+    for page_number, text, seconds, cut in _iter_reader_pages(pdf_reader, max_pages, max_chars, max_seconds):
+        page_cut = page_cut or cut
+        parts.append(text)
+        page_timings.append({"page": page_number, "seconds": round(seconds, 4), "chars": len(text)})
+
+    # Join once instead of growing the string page by page; the page breaks
+    # let compress_profile tell running headers/footers from repeated content
+    text = PAGE_BREAK.join(parts)
+    metadata = {
+        "pages_read": len(page_timings),
+        "total_pages": total_pages,
+        "chars": len(text),
+        # Skipped pages or a shortened page; the joined text's length also counts page breaks
+        "truncated": len(page_timings) < total_pages or page_cut,
+        "page_timings": page_timings,
+        "elapsed_seconds": round(time.perf_counter() - started, 4)
+    }
+    return text, metadata
+
+
+def extract_pdf_bytes(data: bytes, max_pages: int = PDF_MAX_PAGES, max_chars: int = PDF_MAX_CHARS, max_seconds: float = PDF_MAX_SECONDS) -> tuple[str, dict]:
+    """Like extract_pdf_text, but for raw upload bytes and cached by their digest.
+
+    Repeated uploads of the same file skip PyPDF2 entirely. The metadata
+    gains the SHA-256 "digest" of the bytes and a "cached" flag.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    cache_key = (digest, max_pages, max_chars, max_seconds)
+    cached = _text_cache.get(cache_key)
+    if cached is not None:
+        text, metadata = cached
+        return text, {**metadata, "cached": True}
+
+    text, metadata = extract_pdf_text(BytesIO(data), max_pages, max_chars, max_seconds)
+    metadata = {**metadata, "digest": digest}
+    _text_cache.set(cache_key, (text, metadata))
+    return text, {**metadata, "cached": False}
@@ -0,0 +1,258 @@
+"""
+Prompt registry for the LinkedIn Post Generator agent.
+Every prompt template is registered once at import time. Registration
+normalizes whitespace (indentation and blank-line runs cost tokens but carry
+no meaning for the model), fingerprints the normalized text with a version
+hash for cache keys, and records the template's token estimate.
+Run `python prompts.py` for a per-template token report.
+"""
+
+import hashlib
+import re
+import string
+
+from text_processing import estimate_tokens
+
+
+def normalize_template(text: str) -> str:
+    """Strips indentation and trailing spaces and collapses blank-line runs."""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+class PromptTemplate:
+    """A normalized prompt template rendered with str.format placeholders."""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = normalize_template(text)
+        self.version = hashlib.sha256(self.text.encode("utf-8")).hexdigest()[:12]
+        self.fields = sorted({field for _, field, _, _ in string.Formatter().parse(self.text) if field})
+        # Cost of the fixed instructions, i.e. the template without its placeholders
+        self.tokens = estimate_tokens(self.text.format(**{field: "" for field in self.fields}))
+        self.raw_tokens = estimate_tokens(text)
+
+    def render(self, **values) -> str:
+        return self.text.format(**values)
+
+
+class PromptRegistry:
+    """Named prompt templates; each name is registered once."""
+
+    def __init__(self):
+        self._templates = {}
+
+    def register(self, name: str, text: str) -> PromptTemplate:
+        if name in self._templates:
+            raise ValueError(f"Prompt template '{name}' is already registered")
+        template = self._templates[name] = PromptTemplate(name, text)
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def render(self, name: str, **values) -> str:
+        return self._templates[name].render(**values)
+
+    def version(self, *names: str) -> str:
+        """Returns a hash covering the given templates (all of them if none are named)."""
+        digest = hashlib.sha256()
+        for name in names or sorted(self._templates):
+            digest.update(f"{name}={self._templates[name].version};".encode("utf-8"))
+        return digest.hexdigest()[:12]
+
+    def report(self) -> list[dict]:
+        """Returns name, version, fixed token cost and pre-normalization cost per template."""
+        return [
+            {"name": t.name, "version": t.version, "tokens": t.tokens, "raw_tokens": t.raw_tokens, "fields": t.fields}
+            for t in self._templates.values()
+        ]
+
+
+registry = PromptRegistry()
+
+registry.register("analysis", """
+    Analyze the following professional text from a resume or LinkedIn profile.
+    Your task is to create a concise summary of the user's professional persona.
+
+    **Instructions:**
+    1. Identify their industry and primary role (e.g., "Senior Software Engineer in FinTech").
+    2. List their top 3-5 core competencies or skills.
+    3. Describe their writing style and tone (e.g., "Formal and data-driven," "Casual and story-focused," "Technical and precise").
+    4. Note their level of experience (entry-level, mid-level, senior, executive).
+    5. Identify their likely audience (peers, clients, industry leaders, students).
+    6. Keep the entire analysis under 150 words.
+
+    **Profile Text:**
+    ---
+    {profile_text}
+    ---
+
+    **Analysis Summary:**
+""")
+
+registry.register("topics", """
+    Based on this professional profile analysis, suggest five engaging and relevant topics for a LinkedIn post.
+    The topics should be distinct and align with the user's expertise and industry.
+
+    **Profile Analysis:**
+    ---
+    {analysis}
+    ---
+
+    **CRITICAL INSTRUCTIONS:**
+    - You MUST return ONLY a valid JSON array of strings
+    - Use exactly this format: ["Topic 1", "Topic 2", "Topic 3", "Topic 4", "Topic 5"]
+    - Do not include any additional text, explanations, or formatting
+    - Each topic should be a complete, actionable phrase
+    - Topics should be 5-15 words long
+
+    Example response format:
+    ["AI in Modern Software Development", "The Future of Remote Collaboration", "Building High-Performance Teams", "Data-Driven Decision Making", "Career Growth Strategies"]
+""")
+
+registry.register("analysis_and_topics", """
+    Analyze the following professional text from a resume or LinkedIn profile, then suggest LinkedIn post topics for this person.
+
+    **Analysis Instructions:**
+    1. Identify their industry and primary role (e.g., "Senior Software Engineer in FinTech").
+    2. List their top 3-5 core competencies or skills.
+    3. Describe their writing style and tone (e.g., "Formal and data-driven," "Casual and story-focused," "Technical and precise").
+    4. Note their level of experience (entry-level, mid-level, senior, executive).
+    5. Identify their likely audience (peers, clients, industry leaders, students).
+    6. Keep the entire analysis under 150 words.
+
+    **Topic Instructions:**
+    - Suggest five engaging and relevant topics for a LinkedIn post, based on the analysis
+    - The topics should be distinct and align with the user's expertise and industry
+    - Each topic should be a complete, actionable phrase
+    - Topics should be 5-15 words long
+
+    **Profile Text:**
+    ---
+    {profile_text}
+    ---
+
+    **CRITICAL INSTRUCTIONS:**
+    - Return ONLY valid JSON with no additional text
+    - Use exactly this structure:
+
+    {{"analysis": "Concise persona summary", "topics": ["Topic 1", "Topic 2", "Topic 3", "Topic 4", "Topic 5"]}}
+""")
+
+# Posts are requested with a context (system instruction) holding everything
+# that stays fixed for a session's analysis, plus a short per-request delta
+registry.register("posts_context", """
+    Act as a LinkedIn ghostwriter and content strategist. Each request asks you to generate a number of distinct LinkedIn post drafts.
+
+    **CRUCIAL INSTRUCTIONS:**
+    1. **Persona Adoption:** You MUST adopt the writing style and professional persona described in the 'Profile Analysis'. The posts must sound like the user wrote them.
+    2. **Tone Alignment:** The posts MUST have the tone given in the request.
+    3. **Purpose Fulfillment:** The primary goal of the posts is the purpose given in the request.
+    4. **Format:** Use the format structure given in the request.
+    5. **Character Limit:** Keep each post under the character limit given in the request.
+    6. **Hashtags:** Follow the hashtag instruction in the request.
+    7. **CRITICAL:** Follow the output instruction in the request exactly.
+
+    **Profile Analysis (Your Writing Guide):**
+    ---
+    {analysis}
+    ---
+
+    **Post Format Guidelines:**
+    - Story Format: Use narrative structure with personal anecdotes
+    - Question Format: Start with an engaging question to drive discussion
+    - List Format: Use numbered points or bullet-style content
+    - How-to Format: Provide step-by-step guidance
+    - Insight Format: Share professional observations and learnings
+    - Problem-Solution Format: Identify a challenge and present solutions
+
+    **Requirements:**
+    - Create the requested number of unique posts that correctly synthesize the persona, tone, purpose, and format.
+    - Each post should feel authentic and engaging.
+    - Vary the hooks and content structure across posts.
+""")
+
+registry.register("posts", """
+    Generate {num_posts} distinct LinkedIn post drafts.
+
+    **Topic to Write About:** "{topic}"
+    **Tone:** '{tone}'
+    **Purpose:** '{purpose}'
+    **Format:** '{post_format}'
+    **Character Limit:** under {char_limit} characters per post
+    **Hashtags:** {hashtag_instruction}
+    **Output:** {output_instruction}
+    {output_requirements}
+""")
+
+registry.register("media", """
+    Based on the following topic and post content style, suggest appropriate visual media types for LinkedIn posts:
+
+    **Topic:** "{topic}"
+    **Tone:** "{tone}"
+    **Format:** "{post_format}"
+    **Purpose:** "{purpose}"
+
+    Provide 3-4 specific media suggestions that would complement posts about this topic. For each suggestion, include:
+    1. Media type (e.g., "Infographic", "Behind-the-scenes photo", "Video testimonial")
+    2. Brief description of what it should show
+    3. Why it would be effective for this topic
+
+    Format as a JSON array of objects with keys: "type", "description", "rationale"
+""")
+
+registry.register("engagement_context", """
+    Analyze LinkedIn posts and provide engagement potential insights.
+
+    **CRITICAL INSTRUCTIONS:**
+    - Rate each aspect on a scale of 1-5 (1=poor, 5=excellent)
+    - Provide specific, actionable reasoning for each score
+    - Return ONLY valid JSON format with no additional text
+    - For a single post return one object; for several numbered posts return a JSON array with exactly one object per post, in the same order as the posts
+    - Each object MUST use exactly this structure:
+
+    {{
+        "hook_strength": {{"score": X, "reason": "Brief explanation of opening line effectiveness"}},
+        "content_value": {{"score": X, "reason": "Assessment of educational or inspirational worth"}},
+        "discussion_potential": {{"score": X, "reason": "Likelihood to generate meaningful comments"}},
+        "shareability": {{"score": X, "reason": "Potential for shares and reposts"}}
+    }}
+
+    Analyze:
+    1. Hook strength: How compelling is the opening? Does it grab attention?
+    2. Content value: Does it teach, inspire, or provide useful insights?
+    3. Discussion potential: Will people comment with questions/thoughts?
+    4. Shareability: Is it worth sharing with others?
+""")
+
+registry.register("engagement", """
+    **Post Content:**
+    ---
+    {post_content}
+    ---
+""")
+
+registry.register("engagement_batch", """
+    Analyze each of the following {post_count} LinkedIn posts and return a JSON array of exactly {post_count} objects.
+
+    {numbered_posts}
+""")
+
+registry.register("repair", """
+    Your previous response did not match the required JSON structure.
+    Problem: {error}
+    Required JSON schema: {schema}
+    Previous response:
+    ---
+    {previous_text}
+    ---
+    Return ONLY the corrected JSON, keeping the original content wherever possible.
+""")
+
+
+if __name__ == "__main__":
+    print(f"{'template':<20} {'version':<14} {'tokens':>7} {'raw':>7}")
+    for row in registry.report():
+        print(f"{row['name']:<20} {row['version']:<14} {row['tokens']:>7} {row['raw_tokens']:>7}")
+    print(f"registry version: {registry.version()}")
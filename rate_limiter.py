@@ -0,0 +1,234 @@
+"""
+Client-side rate limiting for the shared Gemini API key.
+RateLimiter meters requests and estimated tokens per minute with two token
+buckets and queues callers that would exceed them. Waiting callers are
+served by priority (interactive work before background scoring), then in
+arrival order. With a state path the buckets live in a SQLite file, so every
+process using the same file shares one quota.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+# Per-minute quotas for the API key (defaults match the Gemini free tier)
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "15"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+# SQLite file holding the buckets shared between processes ("" keeps them in-process)
+RATE_LIMIT_STATE_PATH = os.getenv("RATE_LIMIT_STATE_PATH", "")
+
+# Scheduling priorities; lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# How often waiters re-check buckets that other processes may also drain
+_SHARED_POLL_SECONDS = 0.25
+
+
+class RateLimitTimeout(RuntimeError):
+    """Raised when a caller could not be admitted before its timeout."""
+
+
+class RequestCancelled(RuntimeError):
+    """Raised instead of admitting a request whose caller no longer wants the result."""
+
+
+class _LocalBuckets:
+    """Request and token buckets held in process memory."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.capacity = {"requests": float(requests_per_minute), "tokens": float(tokens_per_minute)}
+        self._levels = dict(self.capacity)
+        self._updated = time.monotonic()
+
+    def take(self, tokens: float) -> float:
+        """Takes one request and tokens if available; otherwise returns the seconds until they will be."""
+        now = time.monotonic()
+        levels = _refill(self._levels, self.capacity, now - self._updated)
+        self._updated = now
+        wait = _wait_seconds(levels, self.capacity, tokens)
+        if wait == 0:
+            levels = {"requests": levels["requests"] - 1, "tokens": levels["tokens"] - tokens}
+        self._levels = levels
+        return wait
+
+
+class _SharedBuckets:
+    """Request and token buckets stored in SQLite and shared by all processes using the file."""
+
+    def __init__(self, path: str, requests_per_minute: int, tokens_per_minute: int):
+        self.path = path
+        self.capacity = {"requests": float(requests_per_minute), "tokens": float(tokens_per_minute)}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def take(self, tokens: float) -> float:
+        now = time.time()
+        with self._connect() as conn:
+            # IMMEDIATE takes the write lock up front, so read-refill-write is atomic across processes
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = {name: (level, updated) for name, level, updated in conn.execute("SELECT name, level, updated FROM buckets")}
+                levels = {}
+                for name, capacity in self.capacity.items():
+                    level, updated = rows.get(name, (capacity, now))
+                    levels[name] = min(capacity, level + max(0.0, now - updated) * capacity / 60)
+                wait = _wait_seconds(levels, self.capacity, tokens)
+                if wait == 0:
+                    levels = {"requests": levels["requests"] - 1, "tokens": levels["tokens"] - tokens}
+                conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                    [(name, level, now) for name, level in levels.items()]
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        # Other processes may free capacity sooner than our estimate says
+        return min(wait, _SHARED_POLL_SECONDS) if wait else 0
+
+
+def _refill(levels: dict, capacity: dict, elapsed: float) -> dict:
+    return {name: min(capacity[name], levels[name] + elapsed * capacity[name] / 60) for name in levels}
+
+
+def _wait_seconds(levels: dict, capacity: dict, tokens: float) -> float:
+    """Returns 0 if one request with tokens fits in the buckets, else the seconds until it will."""
+    needed = {"requests": 1.0, "tokens": tokens}
+    wait = 0.0
+    for name, amount in needed.items():
+        if levels[name] < amount:
+            wait = max(wait, (amount - levels[name]) * 60 / capacity[name])
+    return wait
+
+
+class RateLimiter:
+    """Priority scheduler over per-minute request and token buckets.
+
+    acquire() blocks until the caller may send one request of the given
+    estimated size and returns how long it waited. Only the highest-priority,
+    longest-waiting caller draws from the buckets, so background work never
+    overtakes queued interactive requests.
+    """
+
+    def __init__(self, requests_per_minute: int = GEMINI_RPM, tokens_per_minute: int = GEMINI_TPM, state_path: str = ""):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        if state_path:
+            self._buckets = _SharedBuckets(state_path, requests_per_minute, tokens_per_minute)
+        else:
+            self._buckets = _LocalBuckets(requests_per_minute, tokens_per_minute)
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._stats = {
+            priority: {"admitted": 0, "timed_out": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for priority in (INTERACTIVE, BACKGROUND)
+        }
+
+    def acquire(self, tokens: int, priority: int = INTERACTIVE, timeout: float | None = None, cancel: threading.Event | None = None) -> float:
+        """Waits until one request with the given estimated tokens may be sent.
+
+        Raises RateLimitTimeout if that takes longer than timeout seconds, and
+        RequestCancelled (without spending any quota) once cancel is set.
+        """
+        tokens = min(tokens, self.tokens_per_minute)  # An oversized request must still run eventually
+        started = time.monotonic()
+        ticket = (priority, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        raise RequestCancelled("Request abandoned while waiting for the rate limiter")
+                    wait = None
+                    if self._waiters[0] == ticket:
+                        wait = self._buckets.take(tokens)
+                        if wait == 0:
+                            return self._record(priority, started)
+                    remaining = None if timeout is None else timeout - (time.monotonic() - started)
+                    if remaining is not None and remaining <= 0:
+                        self._stats[priority]["timed_out"] += 1
+                        raise RateLimitTimeout(f"Not admitted by the rate limiter within {timeout:.1f}s")
+                    # A cancel does not notify the condition, so poll for it
+                    poll = _SHARED_POLL_SECONDS if cancel is not None else None
+                    self._cond.wait(min(filter(None, (wait, remaining, poll)), default=None))
+            finally:
+                self._remove(ticket)
+
+    async def acquire_async(self, tokens: int, priority: int = INTERACTIVE, timeout: float | None = None) -> float:
+        """Async counterpart of acquire that waits without blocking the event loop."""
+        tokens = min(tokens, self.tokens_per_minute)
+        started = time.monotonic()
+        ticket = (priority, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._buckets.take(tokens) if self._waiters[0] == ticket else _SHARED_POLL_SECONDS
+                    if wait == 0:
+                        return self._record(priority, started)
+                remaining = None if timeout is None else timeout - (time.monotonic() - started)
+                if remaining is not None and remaining <= 0:
+                    with self._cond:
+                        self._stats[priority]["timed_out"] += 1
+                    raise RateLimitTimeout(f"Not admitted by the rate limiter within {timeout:.1f}s")
+                # Sync waiters are woken by the condition; async ones poll
+                await asyncio.sleep(min(wait, _SHARED_POLL_SECONDS, remaining or wait))
+        finally:
+            with self._cond:
+                self._remove(ticket)
+
+    def _remove(self, ticket) -> None:
+        """Drops a ticket from the queue and lets the next waiter check the buckets. Caller holds _cond."""
+        self._waiters.remove(ticket)
+        heapq.heapify(self._waiters)
+        self._cond.notify_all()
+
+    def _record(self, priority: int, started: float) -> float:
+        waited = time.monotonic() - started
+        stats = self._stats[priority]
+        stats["admitted"] += 1
+        stats["total_wait_seconds"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        return waited
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of callers currently waiting to be admitted."""
+        with self._cond:
+            return len(self._waiters)
+
+    def stats(self) -> dict:
+        """Returns the queue depth and admission/wait statistics per priority."""
+        with self._cond:
+            by_priority = {}
+            for priority, name in ((INTERACTIVE, "interactive"), (BACKGROUND, "background")):
+                stats = self._stats[priority]
+                by_priority[name] = {
+                    **stats,
+                    "queued": sum(1 for waiter in self._waiters if waiter[0] == priority),
+                    "avg_wait_seconds": stats["total_wait_seconds"] / stats["admitted"] if stats["admitted"] else 0.0
+                }
+            return {
+                "queue_depth": len(self._waiters),
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "priorities": by_priority
+            }
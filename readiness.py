@@ -0,0 +1,173 @@
+"""
+Readiness checks for the LinkedIn Post Generator.
+A background thread probes the model upstream every
+READINESS_PROBE_INTERVAL_SECONDS with a token count (no generation, so it
+costs no generation quota) and caches the result. Readiness reports read
+that cached result, so load-balancer probes never call the API themselves.
+A worker is ready when the last probe succeeded and is recent enough, the
+circuit breaker is not open, the rate limiter queue is not backed up and
+the recent model call error rate is acceptable. The last three describe the
+process making the model calls, so they are only checked there; until the
+first probe completes the worker reports that it is starting.
+"""
+
+import datetime
+import os
+import threading
+import time
+
+import instrumentation
+from resilience import DEFAULT_CALL_TIMEOUT_SECONDS
+
+READINESS_PROBE_INTERVAL_SECONDS = float(os.getenv("READINESS_PROBE_INTERVAL_SECONDS", "30"))
+# A probe result older than this no longer counts (e.g. the probe call is hanging)
+READINESS_MAX_STALENESS_SECONDS = float(os.getenv("READINESS_MAX_STALENESS_SECONDS", "90"))
+READINESS_MAX_QUEUE_DEPTH = int(os.getenv("READINESS_MAX_QUEUE_DEPTH", "50"))
+READINESS_MAX_ERROR_RATE = float(os.getenv("READINESS_MAX_ERROR_RATE", "0.5"))
+READINESS_ERROR_WINDOW_SECONDS = float(os.getenv("READINESS_ERROR_WINDOW_SECONDS", "60"))
+# Fewer calls than this in the window are too few to judge the error rate
+READINESS_MIN_CALLS = int(os.getenv("READINESS_MIN_CALLS", "5"))
+
+PROBE_TEXT = "readiness probe"
+
+
+def count_tokens_probe() -> None:
+    """Counts tokens for a short text with the shared agent's backend; raises if the upstream fails."""
+    from ai_agent import get_shared_agent
+
+    # A hung probe must not outlast the interval, or the next probe would start late
+    get_shared_agent().backend.count_tokens(PROBE_TEXT, timeout=min(READINESS_PROBE_INTERVAL_SECONDS, DEFAULT_CALL_TIMEOUT_SECONDS))
+
+
+class UpstreamProbe:
+    """Runs probe on a daemon thread every interval seconds and keeps the latest result."""
+
+    def __init__(self, probe=count_tokens_probe, interval: float = READINESS_PROBE_INTERVAL_SECONDS, max_staleness: float = READINESS_MAX_STALENESS_SECONDS):
+        self.probe = probe
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self._lock = threading.Lock()
+        self._result = None
+        self._last_success = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Starts the probe thread unless it is already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="readiness-probe", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+    def run_once(self) -> dict:
+        """Probes the upstream now and stores the result."""
+        started = time.monotonic()
+        try:
+            self.probe()
+            error = None
+        except Exception as e:
+            error = repr(e)
+            print(f"Readiness probe failed: {e}")
+        finished = time.monotonic()
+        result = {
+            "ok": error is None,
+            "error": error,
+            "latency_seconds": round(finished - started, 4),
+            "checked_at": datetime.datetime.now().isoformat(),
+            "_finished": finished
+        }
+        with self._lock:
+            self._result = result
+            if error is None:
+                self._last_success = finished
+        return result
+
+    def status(self) -> dict:
+        """Returns the cached probe result with its age; never calls the upstream."""
+        with self._lock:
+            result, last_success = self._result, self._last_success
+        now = time.monotonic()
+        if result is None:
+            return {"ok": False, "fresh": False, "pending": True, "error": None}
+        age = now - result["_finished"]
+        success_age = now - last_success if last_success is not None else None
+        return {
+            **{key: value for key, value in result.items() if not key.startswith("_")},
+            "age_seconds": round(age, 1),
+            "last_success_age_seconds": round(success_age, 1) if success_age is not None else None,
+            "fresh": success_age is not None and success_age <= self.max_staleness
+        }
+
+
+_probe = None
+_probe_lock = threading.Lock()
+
+def get_probe() -> UpstreamProbe:
+    """Returns the process-wide upstream probe, starting it on first use."""
+    global _probe
+    with _probe_lock:
+        if _probe is None:
+            _probe = UpstreamProbe()
+        _probe.start()
+        return _probe
+
+
+def readiness_report(pipeline_checks: bool = True) -> dict:
+    """Returns {"ready": bool, "state": ..., "reasons": [...], ...} from cached state only.
+
+    state is "ready", "starting" (only waiting for the first probe) or
+    "not_ready". pipeline_checks adds the circuit breaker, queue depth and
+    error rate checks, which only mean something in the process that makes
+    the model calls (the app, or a health server started inside it).
+    """
+    upstream = get_probe().status()
+    reasons = []
+    if upstream.get("pending"):
+        reasons.append("upstream probe has not completed yet")
+    elif not upstream["ok"]:
+        reasons.append(f"upstream probe failing: {upstream['error']}")
+    elif not upstream["fresh"]:
+        reasons.append("upstream probe result is stale")
+
+    report = {"upstream": upstream, "pipeline_checks": pipeline_checks}
+    if pipeline_checks:
+        from ai_agent import pipeline_stats
+
+        pipeline = pipeline_stats()
+        queue_depth = pipeline["rate_limiter"]["queue_depth"]
+        errors = instrumentation.call_error_rate(READINESS_ERROR_WINDOW_SECONDS)
+        if pipeline["circuit_breaker"] == "open":
+            reasons.append("circuit breaker is open")
+        if queue_depth > READINESS_MAX_QUEUE_DEPTH:
+            reasons.append(f"rate limiter queue depth {queue_depth} exceeds {READINESS_MAX_QUEUE_DEPTH}")
+        if errors["calls"] >= READINESS_MIN_CALLS and errors["error_rate"] > READINESS_MAX_ERROR_RATE:
+            reasons.append(f"model call error rate {errors['error_rate']:.0%} exceeds {READINESS_MAX_ERROR_RATE:.0%}")
+        report.update({
+            "circuit_breaker": pipeline["circuit_breaker"],
+            "queue_depth": queue_depth,
+            "recent_calls": {**errors, "window_seconds": READINESS_ERROR_WINDOW_SECONDS}
+        })
+
+    if not reasons:
+        state = "ready"
+    elif upstream.get("pending") and len(reasons) == 1:
+        state = "starting"
+    else:
+        state = "not_ready"
+    return {
+        "ready": not reasons,
+        "state": state,
+        "reasons": reasons,
+        "timestamp": datetime.datetime.now().isoformat(),
+        **report
+    }
@@ -0,0 +1,264 @@
+"""
+Retry, deadline and circuit-breaker handling for Gemini calls.
+call_with_retry runs a model call under an overall deadline, retrying
+transient failures (429/5xx, timeouts, dropped connections) with jittered
+exponential backoff that honors retry-after hints. Retries are paid for
+from the caller's RetryBudget, and a shared CircuitBreaker fails calls fast
+while the upstream keeps failing.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import os
+import random
+import re
+import threading
+import time
+
+# Per-call deadline used when the caller does not pass a timeout
+DEFAULT_CALL_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "4"))
+# Retries a single session may spend (refilled slowly over time)
+SESSION_RETRY_BUDGET = int(os.getenv("SESSION_RETRY_BUDGET", "10"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# HTTP status codes worth retrying: rate limited or upstream trouble
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRY_AFTER_RE = re.compile(r"retry(?:[ _-]?(?:after|delay|in))?\D{0,20}?(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the model while the circuit breaker is open."""
+
+
+class RetryBudgetExhaustedError(RuntimeError):
+    """Raised when a retryable failure occurs but the session has no retries left."""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Returns True for rate limiting, 5xx responses, timeouts and dropped connections."""
+    if isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    # google.api_core exceptions expose the HTTP status as .code
+    code = getattr(error, "code", None)
+    try:
+        return int(code) in RETRYABLE_STATUS_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """Returns the server's retry-after hint in seconds, if the error carries one."""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return float(retry_after)
+
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if "Retry-After" in headers:
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            pass
+
+    # RetryInfo details and quota messages, e.g. "Please retry in 12.5s"
+    for detail in getattr(error, "details", None) or []:
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+    match = RETRY_AFTER_RE.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+class RetryPolicy:
+    """Jittered exponential backoff settings."""
+
+    def __init__(self, max_attempts: int = MAX_ATTEMPTS, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        """Returns how long to wait before retry number attempt (1-based)."""
+        hint = retry_after_seconds(error)
+        if hint is not None:
+            return hint
+        # "Full jitter": spreads retries from many sessions hitting the same quota
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class RetryBudget:
+    """Token bucket limiting how many retries one session may spend.
+
+    Holds up to capacity retries and regains one every refill_seconds, so a
+    session stuck against a failing upstream cannot multiply its own load.
+    """
+
+    def __init__(self, capacity: int = SESSION_RETRY_BUDGET, refill_seconds: float = 30.0):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_spend(self) -> bool:
+        """Takes one retry from the budget, returning False if none are left."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) / self.refill_seconds)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def remaining(self) -> int:
+        with self._lock:
+            return int(self._tokens)
+
+
+class CircuitBreaker:
+    """Fails calls fast after repeated upstream failures.
+
+    Closed: calls pass through. After failure_threshold consecutive upstream
+    failures it opens and rejects calls for reset_seconds, then lets a single
+    trial call through (half-open); success closes it, failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError if the call should not reach the upstream."""
+        with self._lock:
+            state = self._state()
+            if state == "open" or (state == "half_open" and self._trial_in_flight):
+                raise CircuitOpenError("Gemini upstream is failing; skipping the call until it recovers")
+            if state == "half_open":
+                self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release(self) -> None:
+        """Ends a half-open trial that failed for a non-upstream reason."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+_current_budget = contextvars.ContextVar("retry_budget", default=None)
+
+
+def set_retry_budget(budget: RetryBudget | None) -> None:
+    """Makes budget pay for retries made from the current context (e.g. one Streamlit run)."""
+    _current_budget.set(budget)
+
+
+@contextlib.contextmanager
+def use_retry_budget(budget: RetryBudget | None):
+    """Context-manager form of set_retry_budget that restores the previous budget."""
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def _should_retry(error: Exception, attempt: int, delay: float, deadline: float, policy: RetryPolicy) -> bool:
+    if not is_retryable(error) or attempt >= policy.max_attempts:
+        return False
+    if time.monotonic() + delay >= deadline:
+        return False
+    budget = _current_budget.get()
+    if budget is not None and not budget.try_spend():
+        raise RetryBudgetExhaustedError("Retry budget for this session is exhausted") from error
+    return True
+
+
+def call_with_retry(call, timeout: float, breaker: CircuitBreaker | None = None, policy: RetryPolicy | None = None):
+    """Runs call(remaining_seconds) until it succeeds, retrying transient failures.
+
+    Every attempt receives the time left before the overall deadline so it
+    can bound its own request. Non-retryable errors, an exhausted deadline or
+    retry budget, and an open circuit are raised to the caller.
+    """
+    policy = policy or RetryPolicy()
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = call(max(0.001, deadline - time.monotonic()))
+        except Exception as e:
+            if breaker is not None:
+                breaker.record_failure() if is_retryable(e) else breaker.release()
+            delay = policy.delay(attempt, e)
+            if not _should_retry(e, attempt, delay, deadline, policy):
+                raise
+            print(f"Retrying model call in {delay:.1f}s after attempt {attempt} failed: {e!r}")
+            time.sleep(delay)
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+async def call_with_retry_async(call, timeout: float, breaker: CircuitBreaker | None = None, policy: RetryPolicy | None = None):
+    """Async counterpart of call_with_retry; call(remaining_seconds) returns an awaitable."""
+    policy = policy or RetryPolicy()
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = await call(max(0.001, deadline - time.monotonic()))
+        except asyncio.CancelledError:
+            if breaker is not None:
+                breaker.release()
+            raise
+        except Exception as e:
+            if breaker is not None:
+                breaker.record_failure() if is_retryable(e) else breaker.release()
+            delay = policy.delay(attempt, e)
+            if not _should_retry(e, attempt, delay, deadline, policy):
+                raise
+            print(f"Retrying model call in {delay:.1f}s after attempt {attempt} failed: {e!r}")
+            await asyncio.sleep(delay)
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
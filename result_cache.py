@@ -0,0 +1,162 @@
+"""
+Result caches for the LinkedIn Post Generator agent.
+PersistentCache keeps model results in a local SQLite file so they survive
+process restarts; entries expire after a TTL and the least recently used
+entries are evicted once the cache grows past its size limit. LRUCache is
+the in-process equivalent for results that are cheap to rebuild.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(*parts) -> str:
+    """Returns a SHA-256 hex digest identifying the given key components."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')  # Keep ("ab", "c") distinct from ("a", "bc")
+    return digest.hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace so trivially different copies of a text share a key."""
+    return " ".join(text.split())
+
+
+class PersistentCache:
+    """SQLite-backed key/value cache with TTL expiry and LRU eviction.
+
+    Values are stored as JSON, so anything json.dumps accepts can be cached.
+    Each operation opens its own connection, which keeps the cache safe to
+    share between threads and between processes using the same file.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 1000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Yields a connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str, default=None):
+        """Returns the cached value for key, or default if missing or expired."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            value, expires_at = row
+            if expires_at <= now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return default
+            conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key: str, value) -> None:
+        """Stores value under key, evicting expired and least recently used entries."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl_seconds, now)
+            )
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            conn.execute(
+                """
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+
+    def delete(self, key: str) -> None:
+        """Removes key from the cache if present."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._lock, self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class LRUCache:
+    """Thread-safe in-memory cache that evicts the least recently used entry."""
+
+    def __init__(self, max_entries: int = 128, on_evict=None):
+        # on_evict(key, value) is called, outside the lock, for entries evicted to make room
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, or default if missing."""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value) -> None:
+        """Stores value under key, evicting the oldest entries past max_entries."""
+        evicted = []
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False))
+        if self.on_evict is not None:
+            for evicted_key, evicted_value in evicted:
+                self.on_evict(evicted_key, evicted_value)
+
+    def delete(self, key) -> None:
+        """Removes key from the cache if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,159 @@
+"""
+Response schemas for the LinkedIn Post Generator agent.
+Schemas are plain dicts in a small JSON-Schema subset. The same dict is sent
+to Gemini as the response schema (via to_response_schema) and used to
+validate the parsed response locally (via validate), so a response that
+passes validation can be used without further checks.
+"""
+
+import json
+
+ENGAGEMENT_METRICS = ['hook_strength', 'content_value', 'discussion_potential', 'shareability']
+
+TOPICS_SCHEMA = {
+    "type": "array",
+    "items": {"type": "string", "minLength": 3},
+    "minItems": 3
+}
+
+ANALYSIS_TOPICS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analysis": {"type": "string", "minLength": 1},
+        "topics": TOPICS_SCHEMA
+    },
+    "required": ["analysis", "topics"]
+}
+
+# What the combined response must have locally; its topics are checked on
+# their own, so a usable analysis is kept even when the topics are not
+ANALYSIS_ONLY_SCHEMA = {
+    "type": "object",
+    "properties": {"analysis": ANALYSIS_TOPICS_SCHEMA["properties"]["analysis"]},
+    "required": ["analysis"]
+}
+
+POSTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "posts": {"type": "array", "items": {"type": "string", "minLength": 1}, "minItems": 1}
+    },
+    "required": ["posts"]
+}
+
+MEDIA_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "type": {"type": "string", "minLength": 1},
+            "description": {"type": "string"},
+            "rationale": {"type": "string"}
+        },
+        "required": ["type", "description", "rationale"]
+    },
+    "minItems": 1
+}
+
+_METRIC_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer", "minimum": 1, "maximum": 5},
+        "reason": {"type": "string"}
+    },
+    "required": ["score", "reason"]
+}
+
+ENGAGEMENT_SCHEMA = {
+    "type": "object",
+    "properties": {metric: _METRIC_SCHEMA for metric in ENGAGEMENT_METRICS},
+    "required": ENGAGEMENT_METRICS
+}
+
+ENGAGEMENT_BATCH_SCHEMA = {
+    "type": "array",
+    "items": ENGAGEMENT_SCHEMA
+}
+
+# Keywords Gemini's response schema understands; the rest are local-only checks
+_RESPONSE_SCHEMA_KEYS = {"type", "properties", "required", "items", "enum", "description", "nullable"}
+
+_TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool)
+}
+
+
+class SchemaError(ValueError):
+    """Raised when a model response does not match its declared schema."""
+
+
+def validate(data, schema: dict, path: str = "$") -> None:
+    """Raises SchemaError describing the first place data deviates from schema."""
+    expected_type = schema.get("type")
+    if expected_type and not _TYPE_CHECKS[expected_type](data):
+        raise SchemaError(f"{path}: expected {expected_type}, got {type(data).__name__}")
+
+    if "enum" in schema and data not in schema["enum"]:
+        raise SchemaError(f"{path}: {data!r} is not one of {schema['enum']}")
+    if "minimum" in schema and data < schema["minimum"]:
+        raise SchemaError(f"{path}: {data} is below the minimum of {schema['minimum']}")
+    if "maximum" in schema and data > schema["maximum"]:
+        raise SchemaError(f"{path}: {data} is above the maximum of {schema['maximum']}")
+    if "minLength" in schema and len(data.strip()) < schema["minLength"]:
+        raise SchemaError(f"{path}: text is shorter than {schema['minLength']} characters")
+
+    if expected_type == "object":
+        for key in schema.get("required", []):
+            if key not in data:
+                raise SchemaError(f"{path}: missing required key '{key}'")
+        for key, property_schema in schema.get("properties", {}).items():
+            if key in data:
+                validate(data[key], property_schema, f"{path}.{key}")
+
+    if expected_type == "array":
+        if "minItems" in schema and len(data) < schema["minItems"]:
+            raise SchemaError(f"{path}: expected at least {schema['minItems']} items, got {len(data)}")
+        if "maxItems" in schema and len(data) > schema["maxItems"]:
+            raise SchemaError(f"{path}: expected at most {schema['maxItems']} items, got {len(data)}")
+        if "items" in schema:
+            for index, item in enumerate(data):
+                validate(item, schema["items"], f"{path}[{index}]")
+
+
+def to_response_schema(schema: dict) -> dict:
+    """Returns the subset of schema that can be sent as Gemini's response_schema."""
+    response_schema = {}
+    for key, value in schema.items():
+        if key not in _RESPONSE_SCHEMA_KEYS:
+            continue
+        if key == "properties":
+            value = {name: to_response_schema(property_schema) for name, property_schema in value.items()}
+        elif key == "items":
+            value = to_response_schema(value)
+        response_schema[key] = value
+    return response_schema
+
+
+def parse_json_response(response_text: str, schema: dict):
+    """Parses a model response as JSON and validates it against schema.
+
+    Tolerates a Markdown code fence or stray text around the JSON value.
+    Raises ValueError (json.JSONDecodeError or SchemaError) on failure.
+    """
+    text = response_text.strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        opener, closer = ('[', ']') if schema.get("type") == "array" else ('{', '}')
+        start_idx = text.find(opener)
+        end_idx = text.rfind(closer) + 1
+        if start_idx < 0 or end_idx <= start_idx:
+            raise
+        data = json.loads(text[start_idx:end_idx])
+    validate(data, schema)
+    return data
@@ -0,0 +1,131 @@
+"""
+Request coalescing for identical in-flight model calls.
+SingleFlight lets the first caller for a key run the call while concurrent
+callers with the same key wait for it and receive the same result, or the
+same exception. Nothing is kept once the call finishes; this is not a cache.
+"""
+
+import asyncio
+import threading
+
+
+class _SharedCancel:
+    """Cancel token for a shared call, set only once every caller has set its own event.
+
+    Offers the is_set() of a threading.Event. A caller without an event keeps
+    the call alive, and once set the token stays set, so no caller can join
+    a call that has already been abandoned.
+    """
+
+    def __init__(self):
+        self._events = []
+        self._required = False
+        self._set = False
+        self._lock = threading.Lock()
+
+    def join(self, cancel: threading.Event | None) -> bool:
+        """Adds a caller's event; returns False if the call was already abandoned."""
+        with self._lock:
+            if self._set:
+                return False
+            if cancel is None:
+                self._required = True
+            else:
+                self._events.append(cancel)
+            return True
+
+    def is_set(self) -> bool:
+        with self._lock:
+            if not self._set:
+                self._set = not self._required and all(event.is_set() for event in self._events)
+            return self._set
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.cancel = _SharedCancel()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key, for threads and coroutines."""
+
+    def __init__(self):
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key, fn, timeout: float | None = None, cancel: threading.Event | None = None):
+        """Returns fn(token), sharing one execution with concurrent callers of the same key.
+
+        token is set only once every caller has set its cancel event, so one
+        caller giving up never cancels the call for the others.
+        Waiting callers raise TimeoutError if the shared call outlives their timeout.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None or not call.cancel.join(cancel)
+            if leader:
+                call = self._calls[key] = _Call()
+                call.cancel.join(cancel)
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError("Timed out waiting for an identical in-flight request")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(call.cancel)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                # An abandoned call may already have been replaced by a new one
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, coroutine_fn):
+        """Async counterpart of do; coroutine_fn() is awaited once per key and event loop.
+
+        The shared call is cancelled only when every caller waiting on it has been cancelled.
+        """
+        task_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            entry = self._tasks.get(task_key)
+            if entry is None:
+                entry = self._tasks[task_key] = {"task": asyncio.ensure_future(coroutine_fn()), "waiters": 0}
+                entry["task"].add_done_callback(lambda _: self._forget(task_key, entry))
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+            entry["waiters"] += 1
+
+        try:
+            return await asyncio.shield(entry["task"])
+        except asyncio.CancelledError:
+            with self._lock:
+                entry["waiters"] -= 1
+                if entry["waiters"] == 0:
+                    entry["task"].cancel()
+            raise
+
+    def _forget(self, task_key, entry) -> None:
+        with self._lock:
+            if self._tasks.get(task_key) is entry:
+                del self._tasks[task_key]
+
+    def stats(self) -> dict:
+        """Returns upstream calls made, calls that joined one in flight, and calls in flight now."""
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls) + len(self._tasks)}
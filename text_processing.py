@@ -0,0 +1,200 @@
+"""
+Local text preprocessing for the LinkedIn Post Generator agent.
+Resume text is condensed before it is sent to the model: repeated page
+headers/footers, contact details and whitespace runs are removed, and the
+remaining sections are kept in priority order until the token budget is spent.
+Everything here is deterministic, so the same input always yields the same
+prompt (and the same cache key).
+"""
+
+import math
+import os
+import re
+
+# Approximate input tokens allowed for the profile text in the analysis prompt
+PROFILE_TOKEN_BUDGET = int(os.getenv("PROFILE_TOKEN_BUDGET", "1500"))
+
+# Rough characters-per-token ratio for English text with Gemini tokenizers
+CHARS_PER_TOKEN = 4
+
+# Section headings and their priority (lower is kept first)
+SECTION_PRIORITIES = {
+    "summary": 0, "professional summary": 0, "about": 0, "about me": 0, "profile": 0, "objective": 0,
+    "experience": 1, "work experience": 1, "professional experience": 1, "work history": 1, "employment": 1, "employment history": 1,
+    "skills": 2, "technical skills": 2, "core competencies": 2, "key skills": 2,
+    "projects": 3, "key projects": 3, "achievements": 3, "accomplishments": 3, "awards": 3,
+    "publications": 4, "certifications": 4, "education": 4, "volunteer": 5, "volunteering": 5, "languages": 5,
+    "interests": 8, "hobbies": 8, "references": 9,
+}
+# Lines before the first heading (name and headline) are kept with the summary
+HEADER_PRIORITY = 0
+UNKNOWN_SECTION_PRIORITY = 6
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(\.[\w-]+)+")
+URL_RE = re.compile(r"(https?://|www\.)\S+|\b(linkedin|github)\.com/\S*", re.IGNORECASE)
+PHONE_RE = re.compile(r"(?<!\w)\+?\(?\d[\d\s().-]{7,}\d(?!\w)")
+# Contact labels left with nothing after them once the details are removed
+CONTACT_LABEL_RE = re.compile(
+    r"\b(phone|tel|telephone|mobile|cell|e-?mail|linkedin|github|website|web)\s*:\s*(?=$|[|•·,;])", re.IGNORECASE
+)
+# Runs of separators left between removed details
+SEPARATOR_RUN_RE = re.compile(r"([|•·])(\s*[|•·,;])+")
+YEAR_RE = re.compile(r"(19|20)\d\d")
+# Page separator emitted by pdf_extractor between pages
+PAGE_BREAK = "\f"
+# Lines at the top or bottom of a page that can be a running header/footer
+PAGE_EDGE_LINES = 3
+
+# At most three digits, so a year on a line of its own is never taken for a page number
+PAGE_NUMBER_RE = re.compile(r"^(page\s*)?\d{1,3}(\s*(of|/)\s*\d{1,3})?$|^-\s*\d{1,3}\s*-$", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of model tokens in text without calling the API."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _is_phone_number(text: str) -> bool:
+    """True for at least 10 digits that are not a run of dates (e.g. "2016-2018 2019-2021" or "01.2016 - 12.2018")."""
+    groups = re.findall(r"\d+", text)
+    if sum(len(group) for group in groups) < 10:
+        return False
+    years = sum(1 for group in groups if YEAR_RE.fullmatch(group))
+    looks_like_dates = years >= 2 and all(YEAR_RE.fullmatch(group) or len(group) <= 2 for group in groups)
+    return not looks_like_dates
+
+
+def _clean_line(line: str) -> str:
+    line = EMAIL_RE.sub("", line)
+    line = URL_RE.sub("", line)
+    # Employment dates are kept: the analysis judges the level of experience from them
+    line = PHONE_RE.sub(lambda match: "" if _is_phone_number(match.group()) else match.group(), line)
+    line = " ".join(line.split())
+    line = CONTACT_LABEL_RE.sub("", line)
+    # Separators left behind once contact details are removed
+    line = SEPARATOR_RUN_RE.sub(r"\1", line)
+    return line.strip(" |•·,;-")
+
+
+def _section_priority(line: str, allow_unknown: bool) -> int | None:
+    """Returns the priority if the line is a section heading, otherwise None."""
+    heading = line.lower().rstrip(":").strip()
+    if len(heading) > 40:
+        return None
+    if heading in SECTION_PRIORITIES:
+        return SECTION_PRIORITIES[heading]
+    # Short all-caps lines are headings too (e.g. "VOLUNTEER WORK"), but only
+    # once a known heading was seen, since resumes often open with an all-caps name
+    if allow_unknown and line.isupper() and len(line.split()) <= 4:
+        return UNKNOWN_SECTION_PRIORITY
+    return None
+
+
+def _shorten(line: str, limit: int) -> str:
+    """Cuts line to at most limit characters, at a word boundary when there is one."""
+    if len(line) <= limit:
+        return line
+    cut = line[:max(0, limit)]
+    if " " in cut and not line[len(cut)].isspace():
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip()
+
+
+def _edge_slots(page: list[str]) -> list[tuple]:
+    """Returns (position, line) pairs for the lines at the top and bottom of a page.
+
+    Positions count from the top ("top", 0..) or the bottom ("bottom", 0..),
+    so a running header/footer keeps its position from page to page.
+    """
+    slots = [(("top", i), i) for i in range(min(PAGE_EDGE_LINES, len(page)))]
+    slots += [(("bottom", i), len(page) - 1 - i) for i in range(min(PAGE_EDGE_LINES, len(page)))]
+    return slots
+
+
+def _running_lines(pages: list[list[str]]) -> set[tuple[int, int]]:
+    """Returns (page, line index) of repeats of lines found in the same edge position on several pages.
+
+    The first occurrence is not included, so e.g. the name on page one stays.
+    """
+    occurrences = {}
+    for page_index, page in enumerate(pages):
+        for position, line_index in _edge_slots(page):
+            key = (position, page[line_index].lower())
+            occurrences.setdefault(key, set()).add((page_index, line_index))
+    repeats = set()
+    for found in occurrences.values():
+        if len(found) > 1:
+            repeats |= set(sorted(found)[1:])
+    return repeats
+
+
+def compress_profile(profile_text: str, token_budget: int = PROFILE_TOKEN_BUDGET) -> tuple[str, dict]:
+    """Condenses profile text to fit the token budget.
+
+    Returns the condensed text and a stats dict with the before/after token
+    estimates, the detected sections and whether anything was cut.
+    """
+    original_tokens = estimate_tokens(profile_text)
+
+    # Normalize lines, dropping contact details, and page numbers at the page edges
+    pages = []
+    for page_text in profile_text.split(PAGE_BREAK):
+        page = [line for line in (_clean_line(raw_line) for raw_line in page_text.splitlines()) if line]
+        edges = {line_index for _, line_index in _edge_slots(page)}
+        pages.append([line for line_index, line in enumerate(page) if line_index not in edges or not PAGE_NUMBER_RE.match(line)])
+
+    # PyPDF2 emits the same header/footer on every page; keep its first
+    # occurrence and drop the repeats at later page edges. Lines repeated
+    # inside a page (e.g. the same job title twice) are content and stay.
+    running = _running_lines(pages)
+    lines = [
+        line
+        for page_index, page in enumerate(pages)
+        for line_index, line in enumerate(page)
+        if (page_index, line_index) not in running
+    ]
+
+    # Split into sections at detected headings
+    sections = [{"heading": None, "priority": HEADER_PRIORITY, "lines": []}]
+    for line in lines:
+        priority = _section_priority(line, allow_unknown=len(sections) > 1)
+        if priority is not None:
+            sections.append({"heading": line, "priority": priority, "lines": [line]})
+        else:
+            sections[-1]["lines"].append(line)
+
+    # Fill the budget section by section in priority order, cutting the
+    # section that crosses the budget down to its leading lines; the line
+    # that crosses it is shortened rather than dropped, so a long pasted
+    # paragraph still contributes its beginning
+    chars_left = token_budget * CHARS_PER_TOKEN
+    kept = {}
+    shortened = False
+    for index in sorted(range(len(sections)), key=lambda i: sections[i]["priority"]):
+        kept_lines = []
+        for line in sections[index]["lines"]:
+            if len(line) + 1 > chars_left:
+                line = _shorten(line, chars_left - 1)
+                if line:
+                    kept_lines.append(line)
+                    chars_left -= len(line) + 1
+                    shortened = True
+                break
+            kept_lines.append(line)
+            chars_left -= len(line) + 1
+        # A heading without any of its content only wastes tokens
+        if sections[index]["heading"] and len(kept_lines) == 1:
+            chars_left += len(kept_lines[0]) + 1
+        elif kept_lines:
+            kept[index] = kept_lines
+
+    compressed_text = "\n".join(line for index in sorted(kept) for line in kept[index])
+    compressed_tokens = estimate_tokens(compressed_text)
+    stats = {
+        "original_tokens": original_tokens,
+        "compressed_tokens": compressed_tokens,
+        "saved_tokens": original_tokens - compressed_tokens,
+        "sections": [section["heading"] for section in sections if section["heading"]],
+        "truncated": shortened or sum(len(kept_lines) for kept_lines in kept.values()) < len(lines)
+    }
+    return compressed_text, stats